@@ -9,9 +9,11 @@ setup(
     packages=find_packages(where='src'),
     package_dir={'': 'src'},
     python_requires='>=3.5',
-    scripts=['bin/cemconvert','bin/get_camd_cems','bin/get_camd_cems_bulk'],
+    scripts=['bin/cemconvert','bin/get_camd_cems','bin/get_camd_cems_bulk',
+      'bin/cemconvert-merge'],
     setup_requires=['numpy>=1.19.5','pandas>=1.1.0'],
     install_requires=['numpy>=1.19.5','pandas>=1.1.0'],
+    extras_require={'columnar': ['pyarrow>=1.0.0'], 'zstd': ['zstandard>=0.15']},
     package_data={'cemconvert': ['examples/*.csh','data/*.csv']},
     author_email='beidler.james@epa.gov'
 )
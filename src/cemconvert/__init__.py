@@ -2,7 +2,7 @@ __doc__ = r"""
 Cemconvert
 """
 
-__all__ = ['cem','ff10','qa','run_parse','temporal','proc','tz','cemcorrect']
+__all__ = ['cem','ff10','qa','run_parse','temporal','proc','tz','cemcorrect','hourly','scale','columnar','compress','dateindex','subset','partition','merge','sweep','profiles','pipeline','run','RunResult','RunConfig']
 
 import cemconvert.proc
 import cemconvert.cem
@@ -11,3 +11,16 @@ import cemconvert.run_parse
 import cemconvert.qa
 import cemconvert.temporal
 import cemconvert.cemcorrect
+import cemconvert.hourly
+import cemconvert.scale
+import cemconvert.columnar
+import cemconvert.compress
+import cemconvert.dateindex
+import cemconvert.subset
+import cemconvert.partition
+import cemconvert.merge
+import cemconvert.sweep
+import cemconvert.profiles
+import cemconvert.pipeline
+from cemconvert.pipeline import run, RunResult
+from cemconvert.run_parse import RunConfig
@@ -1,12 +1,18 @@
 import os.path
+import io
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import pandas as pd
+from cemconvert.compress import COMPRESS_EXT, find_file, open_text
+from cemconvert.dateindex import DateIndex
 
 class CEM:
     '''
     Functions related to CEM format processing
     '''
 
-    def __init__(self):
+    def __init__(self, subset=None):
+        # Optional Subset of facilities, units, and states to keep as the files are read
+        self.subset = subset
         # Columns to read in. Use exactly these column names as specified by CAMD.
         self.cemcols = ['Facility ID','Unit ID','Date','Hour','Gross Load (MW)',
           'Steam Load (1000 lb/hr)','SO2 Mass (lbs)','CO2 Mass (short tons)','Heat Input (mmBtu)',
@@ -25,6 +31,8 @@ class CEM:
           'Heat Input Measure Indicator': 'HIMEAS'}
         # Value columns from the CEM file to set as values in the resulting pivot 
         self.valcols = ['GLOAD','SLOAD','HTINPUT','SO2','CO2','NOX','OPTIME']#,'SO2MEAS','NOXMEAS','CO2MEAS']
+        # Mass columns reported in lbs that are converted to tons
+        self.lbscols = ['SO2','NOX']
         # Measurement names to integer codes
         self.measxref = {'Measured': 1, 'Calculated': 2, 'Substitute': 3,
           'Measured and Substitute': 4, 'LME': 5, 'Other': 6}
@@ -44,27 +52,92 @@ class CEM:
             df[col] = df[col].replace(to_replace=self.measxref).fillna(0).astype(int)
         return df
 
-    def load_cems_period(self, input_path, year, period):
+    def load_cems_period(self, input_path, year, period, workers=0, processes=False):
         '''
         Load in the CAMPD CEMS monthly files of hourly values
         period is a list of months as integers
+        The monthly files may be uncompressed or compressed with gzip, zstandard, or zip
+        The months are read in parallel by a pool of workers. By default there is one worker per
+          month up to the number of CPUs. Set processes to use a process pool instead of threads.
+        Each month is logged as its read completes.
         ''' 
-        for n in period:
-            month = self.months[n-1]
-            print('Processing %s' %month, flush=True)
-            # Read in CAMPD CEM inputs
-            fn = os.path.join(input_path, 'campd-%s-%s-hourly.txt' %(year, month))
-            self.hourly = pd.concat((self.hourly, self.read_cems_month(fn)))
+        period = list(period)
+        # Find the CAMPD CEM inputs before starting any reads
+        fns = [self.get_month_fn(input_path, year, n) for n in period]
+        if not workers:
+            workers = min(len(fns), os.cpu_count() or 1)
+        workers = max(1, min(int(workers), len(fns)))
+        months = [None,] * len(fns)
+        if workers == 1:
+            for n, fn in enumerate(fns):
+                months[n] = self.read_cems_file(fn)
+                self.log_month(fn, months[n])
+        else:
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with pool(max_workers=workers) as executor:
+                futures = dict((executor.submit(self.read_cems_file, fn), n) for n, fn in 
+                  enumerate(fns))
+                for future in as_completed(futures):
+                    n = futures[future]
+                    months[n] = future.result()
+                    self.log_month(fns[n], months[n])
+        # Combine the months in period order with a single concat
+        self.hourly = pd.concat([self.hourly,] + months)
+
+    def log_month(self, fn, df):
+        '''
+        Log a monthly CEM file once it is read
+        '''
+        print('%s records read: %s  NOX sum (lb): %s' %(os.path.basename(fn), len(df), 
+          sum(df['NOX'].fillna(0).round(6))), flush=True)
+
+    def read_cems_file(self, fn):
+        '''
+        Read in a monthly CEM file and report the file name with any errors
+        '''
+        try:
+            return self.read_cems_month(fn)
+        except Exception as e:
+            raise ValueError('Failed reading CEMS file %s: %s' %(fn, e)) from e
 
     def read_cems_month(self, fn):
         '''
         Read in the monthly CEM hourly values and return a dataframe
+        With a subset only the lines that may match the subset are parsed
+        '''
+        with open_text(fn) as f:
+            if self.is_subset():
+                f = self.subset.filter_lines(f)
+            df = pd.read_csv(f, usecols=self.cemcols, dtype=self.get_dtype())
+        return self.format_cems(self.filter_subset(df))
+
+    def is_subset(self):
+        '''
+        Check if the CEMS are limited to a subset
         '''
-        dtype = {'Facility ID': str, 'Unit ID': str, 'SO2 Mass Measure Indicator': str,
+        return self.subset is not None and self.subset.is_set()
+
+    def filter_subset(self, df):
+        '''
+        Filter the CEM records as read from the CAMPD file to the subset
+        '''
+        if self.is_subset():
+            df = self.subset.filter_cems(df)
+        return df
+
+    def get_dtype(self):
+        '''
+        Data types for the CEM columns read as strings
+        '''
+        return {'Facility ID': str, 'Unit ID': str, 'SO2 Mass Measure Indicator': str,
           'NOx Mass Measure Indicator': str, 'CO2 Mass Measure Indicator': str,
           'NOx Rate Measure Indicator': str, 'Heat Input Measure Indicator': str,
           'SO2 Rate Measure Indicator': str, 'CO2 Rate Measure Indicator': str}
-        df = pd.read_csv(fn, usecols=self.cemcols, dtype=dtype)
+
+    def format_cems(self, df):
+        '''
+        Rename and format the CEM columns as read from the CAMPD file
+        '''
         # Rename columns to shorten names and fit formats
         df.rename(columns=self.colmap, inplace=True)
         df['date'] = pd.to_datetime(df.date + ' ' + df.hour.astype(str).str.zfill(2), format='%Y-%m-%d %H')
@@ -73,7 +146,48 @@ class CEM:
         dupes = df.duplicated(['oris_facility_code','oris_boiler_id','date','hour'], keep=False)
         if len(df[dupes]) > 0:
             raise ValueError('Duplicate ORIS/Date/Hour combinations found in CEMS')
-        print('Records read: %s  NOX sum (lb): %s' %(len(df), sum(df['NOX'].fillna(0).round(6))))
+        return df
+
+    def get_month_fn(self, input_path, year, month):
+        '''
+        Find the CAMPD CEM file for a month as an integer
+        '''
+        return find_file(os.path.join(input_path, 'campd-%s-%s-hourly.txt' %(year, 
+          self.months[month-1])))
+
+    def read_cems_dates(self, fn, dates):
+        '''
+        Read only the rows for a list of dates (YYYY-MM-DD) from a monthly CEM file
+        Uncompressed files seek to the rows using a sidecar date index. Compressed files
+          or files that cannot be indexed are streamed and filtered.
+        '''
+        try:
+            if os.path.splitext(fn)[1].lstrip('.') in COMPRESS_EXT:
+                raise ValueError('Compressed files are not indexed')
+            rows = DateIndex(fn).read_dates(dates)
+            df = pd.read_csv(io.BytesIO(rows), usecols=self.cemcols, dtype=self.get_dtype())
+        except ValueError:
+            with open_text(fn) as f:
+                chunks = pd.read_csv(f, usecols=self.cemcols, dtype=self.get_dtype(), 
+                  chunksize=500000)
+                df = pd.concat([chunk[chunk['Date'].isin(dates)] for chunk in chunks])
+        return self.format_cems(self.filter_subset(df))
+
+    def read_boundary_hours(self, input_path, year, month, hours, tail=True):
+        '''
+        Read the last (tail) or first hours of a monthly CEM file
+        '''
+        fn = self.get_month_fn(input_path, year, month)
+        day = pd.Timestamp(int(year), int(month), 1)
+        if tail:
+            day = day + pd.offsets.MonthEnd(0)
+        df = self.read_cems_dates(fn, [day.strftime('%Y-%m-%d'),])
+        if tail:
+            df = df[df['hour'].astype(int) >= 24 - hours].copy()
+        else:
+            df = df[df['hour'].astype(int) < hours].copy()
+        print('%s boundary hours read: %s  records: %s' %(os.path.basename(fn), hours, len(df)),
+          flush=True)
         return df
 
     def write_old_cems(self, output_path, year, period):
@@ -145,7 +259,7 @@ class CEM:
         '''
         idx = ['oris_facility_code','oris_boiler_id','date']
         # Update the pollutant values from lbs->tons
-        for col in ['SO2','NOX']:
+        for col in self.lbscols:
             df[col] = df[col] / 2000
         df['hour'] = 'hrval' + df['hour'].astype(int).astype(str)
         df = df[idx+self.valcols+['hour',]].copy()
@@ -166,3 +280,19 @@ class CEM:
         # Drop daily records that are 0 for every hour
         return df[df['daytot'] > 0].copy()
 
+    def lbs_to_tons(self, df, valcol='daytot'):
+        '''
+        Convert the values for the pollutants reported in lbs to tons in a dataframe by poll
+        '''
+        idx = df['poll'].isin(self.lbscols)
+        df.loc[idx, valcol] = df.loc[idx, valcol] / 2000
+        return df
+
+    def calc_unit_totals(self, df):
+        '''
+        Sum the hourly values to unit/month totals by pollutant for the mass-balance QA
+        '''
+        idx = ['oris_facility_code','oris_boiler_id','month']
+        df = df[idx+self.valcols].groupby(idx, as_index=False).sum()
+        df = pd.melt(df, id_vars=idx, value_vars=self.valcols, var_name='poll', value_name='daytot')
+        return self.lbs_to_tons(df)
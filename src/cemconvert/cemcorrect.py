@@ -4,11 +4,13 @@ class CemCorrect:
     '''
     '''
 
-    def __init__(self):
+    def __init__(self, peakfactor=3, threshold=0.3):
         '''
         '''
-        self.peakfactor = 3
-        self.threshold = 0.3
+        # Factor over the mean for a flagged value to be anomalous
+        self.peakfactor = peakfactor
+        # Fraction of days in the month with values needed to use the monthly mean
+        self.threshold = threshold
         self.heat = 'HTINPUT'
         self.anomcols = ['HIMEAS','NOXMEAS','SO2MEAS','CO2MEAS','noxrmeasure']
         # Value columns from the CEM file to set as values in the resulting pivot 
@@ -19,6 +21,8 @@ class CemCorrect:
         self.unitmonth = self.unithour + ['month',]
         # Init a dataframe to store the unit level hourly mean values
         self.unitmeans = pd.DataFrame()
+        # Init a dataframe to store the annual unit-hour mean values
+        self.hourmeans = pd.DataFrame()
         # Init a dataframe for storing QA
         self.unitqa = pd.DataFrame()
 
@@ -40,6 +44,7 @@ class CemCorrect:
         # Otherwise use the annual mean
         annmeans = df.loc[df[col].notnull(), self.unithour+[col,]].groupby(self.unithour, 
           as_index=False).mean()
+        self.add_hourmeans(annmeans)
         df = pd.merge(df.loc[df['frac'] < self.threshold, self.unitmonth].drop_duplicates(),
           annmeans, on=self.unithour, how='left', suffixes=['','_unit'])
         cols = self.unitmonth + [col,]
@@ -77,12 +82,22 @@ class CemCorrect:
         # Otherwise use the annual mean
         annmeans = df.loc[df[f'{col}_rate'] > 0, self.unithour+[f'{col}_rate',]].groupby(self.unithour,
           as_index=False).mean()
+        self.add_hourmeans(annmeans)
         df = pd.merge(df.loc[df['frac'] < self.threshold, self.unitmonth].drop_duplicates(),
           annmeans, on=self.unithour, how='left', suffixes=['','_unit'])
         cols = self.unitmonth + [f'{col}_rate',]
         df = pd.concat((monmeans[cols], df[cols]))
         self.unitmeans = self.unitmeans.merge(df[df[f'{col}_rate'] > 0], on=self.unitmonth, how='left')
 
+    def add_hourmeans(self, df):
+        '''
+        Keep the annual unit-hour means for filling the hours outside of the run months
+        '''
+        if len(self.hourmeans) > 0:
+            self.hourmeans = self.hourmeans.merge(df, on=self.unithour, how='outer')
+        else:
+            self.hourmeans = df.copy()
+
     def fill_mean(self, col, hourly):
         '''
         Fill the anomalous values with the mean value
@@ -115,6 +130,27 @@ class CemCorrect:
         hourly.loc[idx, col] = hourly.loc[idx, f'{col}_mean']
         return hourly[cols].copy()
 
+    def fill_boundary(self, hourly):
+        '''
+        Fill the anomalous values in hours outside of the run months, such as the boundary hours
+          read from the adjacent months, using the annual unit-hour means of the run months
+        The heat input is filled with the mean heat input and the other values with the mean rate
+          multiplied by the mean heat input
+        '''
+        cols = list(hourly.columns)
+        hourly = hourly.merge(self.hourmeans, on=self.unithour, how='left', suffixes=['','_mean'])
+        for col in self.valcols:
+            if col != self.heat:
+                hourly[f'{col}_mean'] = hourly[f'{col}_rate'].fillna(0) * \
+                  hourly[f'{self.heat}_mean'].fillna(0)
+            idx = ((hourly[self.anomcols].gt(2).any(axis=1)) & \
+              (hourly[col].notnull()) & \
+              (hourly[col] > hourly[f'{col}_mean'] * self.peakfactor) & \
+              (hourly[f'{col}_mean'].fillna(0) > 0))
+            self.store_qa(col, hourly[idx].copy())
+            hourly.loc[idx, col] = hourly.loc[idx, f'{col}_mean']
+        return hourly[cols].copy()
+
     def store_qa(self, col, df):
         '''
         Write the QA to the main QA df
@@ -124,6 +160,16 @@ class CemCorrect:
           self.measmap[col]: 'measurement_code'}, inplace=True)
         self.unitqa = pd.concat((self.unitqa, df))
 
+    def calc_adjustments(self):
+        '''
+        Sum the change in values from the replacements by unit, month, and field
+        '''
+        idx = ['oris_facility_code','oris_boiler_id','month','field']
+        df = self.unitqa[idx+['original_value','replacement_value']].copy()
+        df['daytot'] = df['replacement_value'] - df['original_value']
+        df = df.groupby(idx, as_index=False)['daytot'].sum()
+        return df.rename(columns={'field': 'poll'})
+
     def write_qa(self, fn):
         '''
         Write the CEMCorrect QA
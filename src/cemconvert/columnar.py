@@ -0,0 +1,123 @@
+# Columnar (Parquet and Arrow IPC) outputs of the FF10 inventories
+#  These require the optional pyarrow package
+
+import os.path
+import glob
+import re
+import pandas as pd
+
+# Output format names to file extensions
+COLUMNAR_EXT = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+def get_pyarrow():
+    '''
+    Import pyarrow only when a columnar format is requested
+    '''
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('The pyarrow package is required for parquet and arrow outputs')
+    return pyarrow
+
+def columnar_fn(fn, fmt):
+    '''
+    Swap the extension of an FF10 file name for the columnar format extension
+    '''
+    return '%s.%s' %(os.path.splitext(fn)[0], COLUMNAR_EXT[fmt])
+
+def set_types(df, cols, numcols, datecols=()):
+    '''
+    Get a copy of the output columns with numeric and date types set
+    All other columns are set as strings with blanks as nulls
+    '''
+    df = df[cols].copy()
+    for col in cols:
+        if col in datecols:
+            df[col] = pd.to_datetime(df[col], format='%Y%m%d')
+        elif col in numcols:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        else:
+            df[col] = df[col].where(df[col].notnull() & (df[col].astype(str) != ''), None)
+            df[col] = df[col].astype('string')
+    return df
+
+def write_columnar(df, fn, fmt):
+    '''
+    Write a dataframe to a Parquet or Arrow IPC file
+    '''
+    pa = get_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == 'parquet':
+        pa.parquet.write_table(table, fn)
+    elif fmt == 'arrow':
+        with pa.OSFile(fn, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        raise ValueError('Unknown columnar output format: %s' %fmt)
+    print(fn)
+
+def read_columnar(fn, columns=None):
+    '''
+    Read a Parquet or Arrow IPC file written by cemconvert into a dataframe
+    Both formats are read through a memory map
+    '''
+    pa = get_pyarrow()
+    if fn.endswith('.arrow'):
+        with pa.memory_map(fn, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns:
+            table = table.select(columns)
+    else:
+        table = pa.parquet.read_table(fn, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+def find_parts(output_path, year, label, fn, kind, month=''):
+    '''
+    Find the file for an output or the partition files of a partitioned run
+    The partition files are taken from the run manifest, otherwise they are found by the state,
+      facility, or shard partition suffixes of the file name
+    '''
+    if os.path.exists(fn):
+        return [fn,]
+    fmt = os.path.splitext(fn)[1].lstrip('.')
+    manifest_fn = os.path.join(output_path, 'manifest_%s_%s.csv' %(year, label))
+    if os.path.exists(manifest_fn):
+        manifest = pd.read_csv(manifest_fn, dtype=str, keep_default_na=False)
+        idx = (manifest['type'] == kind) & (manifest['format'] == fmt) & \
+          (manifest['month'] == str(month))
+        fns = [os.path.join(output_path, part_fn) for part_fn in manifest.loc[idx, 'file']]
+        fns = [part_fn for part_fn in fns if os.path.exists(part_fn)]
+        if fns:
+            return fns
+    base, ext = os.path.splitext(fn)
+    return [part_fn for part_fn in sorted(glob.glob('%s_*%s' %(glob.escape(base), ext))) if
+      re.fullmatch(r'_(st\w*|fac.+|part\d+)', part_fn[len(base):-len(ext)])]
+
+def read_hourly(output_path, year, label, fmt='parquet', months=range(1,13), columns=None):
+    '''
+    Read the monthly hourly FF10 for a run into a single dataframe
+    The partition files of a partitioned run are combined
+    '''
+    fns = []
+    for month in months:
+        fn = os.path.join(output_path, 'pthour_%0.2d_%s_%s_hourly.%s' %(month, year, label,
+          COLUMNAR_EXT[fmt]))
+        fns += find_parts(output_path, year, label, fn, 'hourly', int(month))
+    if not fns:
+        raise FileNotFoundError('No %s hourly outputs found for %s %s in %s' %(fmt, year, label,
+          output_path))
+    return pd.concat([read_columnar(fn, columns) for fn in fns], ignore_index=True)
+
+def read_annual(output_path, year, label, fmt='parquet', columns=None):
+    '''
+    Read the annual FF10 for a run
+    The partition files of a partitioned run are combined
+    '''
+    fn = os.path.join(output_path, 'ptinv_%s_%s.%s' %(year, label, COLUMNAR_EXT[fmt]))
+    fns = find_parts(output_path, year, label, fn, 'annual')
+    if not fns:
+        raise FileNotFoundError('No %s annual output found for %s %s in %s' %(fmt, year, label,
+          output_path))
+    return pd.concat([read_columnar(fn, columns) for fn in fns], ignore_index=True)
@@ -0,0 +1,84 @@
+# Transparent streaming access to compressed CEMS and FF10 files
+#  zstandard compression requires the optional zstandard package
+
+import os.path
+import io
+import gzip
+import zipfile
+
+# Supported compression extensions in the order they are searched for
+COMPRESS_EXT = ('gz','zst','zip')
+
+def get_zstandard():
+    '''
+    Import zstandard only when a .zst file is used
+    '''
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('The zstandard package is required for .zst files')
+    return zstandard
+
+def find_file(fn):
+    '''
+    Find a file or a compressed version of the file
+    '''
+    if os.path.exists(fn):
+        return fn
+    for ext in COMPRESS_EXT:
+        if os.path.exists('%s.%s' %(fn, ext)):
+            return '%s.%s' %(fn, ext)
+    raise FileNotFoundError('No uncompressed or compressed (%s) file found for %s' 
+      %(', '.join(COMPRESS_EXT), fn))
+
+def compressed_fn(fn, compress):
+    '''
+    Add the compression extension to the output file name
+    '''
+    compress = compress.strip().lower().lstrip('.')
+    if compress:
+        if compress not in COMPRESS_EXT:
+            raise ValueError('Unknown compression: %s' %compress)
+        fn = '%s.%s' %(fn, compress)
+    return fn
+
+class ZipText(io.TextIOWrapper):
+    '''
+    Text stream of a single member zip file that closes the archive with the stream
+    '''
+
+    def __init__(self, fn, mode):
+        self.archive = zipfile.ZipFile(fn, mode, compression=zipfile.ZIP_DEFLATED)
+        if mode == 'r':
+            member = self.archive.open(self.archive.namelist()[0])
+        else:
+            # Name the member after the archive without the .zip
+            name = os.path.basename(os.path.splitext(fn)[0])
+            member = self.archive.open(name, 'w', force_zip64=True)
+        super().__init__(member, newline='')
+
+    def close(self):
+        super().close()
+        self.archive.close()
+
+def open_text(fn, mode='r'):
+    '''
+    Open a plain or compressed text file for streaming reads or writes
+    The compression is set by the .gz, .zst, or .zip extension
+    '''
+    if mode not in ('r','w'):
+        raise ValueError('Compressed files may only be opened with r or w')
+    ext = os.path.splitext(fn)[1].lower().lstrip('.')
+    if ext == 'gz':
+        return gzip.open(fn, mode+'t', newline='')
+    elif ext == 'zst':
+        zstd = get_zstandard()
+        if mode == 'r':
+            stream = zstd.ZstdDecompressor().stream_reader(open(fn, 'rb'), closefd=True)
+        else:
+            stream = zstd.ZstdCompressor().stream_writer(open(fn, 'wb'), closefd=True)
+        return io.TextIOWrapper(stream, newline='')
+    elif ext == 'zip':
+        return ZipText(fn, mode)
+    else:
+        return open(fn, mode, newline='')
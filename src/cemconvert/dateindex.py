@@ -0,0 +1,95 @@
+import os.path
+import mmap
+import numpy as np
+import pandas as pd
+
+class DateIndex:
+    '''
+    Sidecar index of the byte ranges holding the rows for each date in an uncompressed CEMS file
+    The index is stored next to the CEMS file as <file>.idx and is rebuilt when the CEMS
+      file is newer than the index
+    Rows for a date do not need to be contiguous. Each contiguous run of rows is one range.
+    '''
+
+    def __init__(self, fn, datecol='Date', blocksize=2**26):
+        self.fn = fn
+        self.idx_fn = '%s.idx' %fn
+        self.datecol = datecol
+        # Size of the blocks scanned for line endings when building the index
+        self.blocksize = blocksize
+        # Byte length of the header line
+        self.header_len = 0
+        # Date, start byte, and end byte of each run of rows
+        self.ranges = pd.DataFrame(columns=['date','start','end'])
+        self.load()
+
+    def load(self):
+        '''
+        Read the sidecar index or build it if it is missing or out of date
+        '''
+        if os.path.exists(self.idx_fn) and \
+          os.path.getmtime(self.idx_fn) >= os.path.getmtime(self.fn):
+            idx = pd.read_csv(self.idx_fn, dtype={'date': str})
+            self.header_len = int(idx.loc[idx['date'] == 'header', 'end'].values[0])
+            self.ranges = idx[idx['date'] != 'header'].copy()
+        else:
+            self.build()
+            self.write()
+
+    def find_line_ends(self):
+        '''
+        Find the byte offset just past each line in the file
+        '''
+        size = os.path.getsize(self.fn)
+        ends = []
+        with open(self.fn, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start in range(0, size, self.blocksize):
+                    block = np.frombuffer(mm[start:start+self.blocksize], dtype=np.uint8)
+                    ends.append(np.flatnonzero(block == 10) + start + 1)
+        ends = np.concatenate(ends) if ends else np.array([], dtype=np.int64)
+        # Last line without a line ending
+        if len(ends) == 0 or ends[-1] < size:
+            ends = np.append(ends, size)
+        return ends
+
+    def build(self):
+        '''
+        Build the index from a scan of the line endings and the date column
+        '''
+        ends = self.find_line_ends()
+        dates = pd.read_csv(self.fn, usecols=[self.datecol,], dtype=str, skip_blank_lines=False)
+        dates = dates[self.datecol]
+        if len(dates) != len(ends) - 1:
+            raise ValueError('Cannot index %s: rows do not match lines' %self.fn)
+        self.header_len = int(ends[0])
+        df = pd.DataFrame({'date': dates.values, 'start': ends[:-1], 'end': ends[1:]})
+        # Collapse contiguous rows of the same date into one range
+        run = (df['date'] != df['date'].shift()).cumsum()
+        self.ranges = df.groupby(run, sort=False).agg({'date': 'first', 'start': 'min',
+          'end': 'max'}).reset_index(drop=True)
+
+    def write(self):
+        '''
+        Write the sidecar index. The index is kept in memory when the path is not writable.
+        '''
+        head = pd.DataFrame([['header', 0, self.header_len],], columns=['date','start','end'])
+        try:
+            pd.concat((head, self.ranges)).to_csv(self.idx_fn, index=False)
+        except OSError:
+            print('Could not write date index %s' %self.idx_fn)
+
+    def read_dates(self, dates):
+        '''
+        Read the header and the rows for a list of dates as bytes
+        '''
+        ranges = self.ranges[self.ranges['date'].isin(dates)].sort_values('start')
+        with open(self.fn, 'rb') as f:
+            chunks = [f.read(self.header_len),]
+            for start, end in zip(ranges['start'], ranges['end']):
+                f.seek(int(start))
+                chunk = f.read(int(end) - int(start))
+                if not chunk.endswith(b'\n'):
+                    chunk += b'\n'
+                chunks.append(chunk)
+        return b''.join(chunks)
@@ -2,7 +2,9 @@ import os.path
 import csv
 import numpy as np
 import pandas as pd
-from cemconvert.qa import write_annual_qa
+from cemconvert.compress import open_text
+from cemconvert.columnar import COLUMNAR_EXT, columnar_fn, set_types, write_columnar
+from cemconvert.partition import Partitioner
 
 class FF10:
     '''
@@ -44,6 +46,12 @@ class FF10:
         # Monthly column names
         self.month_vals = ['jan_value','feb_value','mar_value','apr_value','may_value','jun_value',
           'jul_value','aug_value','sep_value','oct_value','nov_value','dec_value']
+        # Numeric annual FF10 columns for the typed columnar outputs
+        self.ann_numcols = ['ann_value','ann_pct_red','stkhgt','stkdiam','stktemp','stkflow','stkvel',
+          'longitude','latitude','design_capacity','current_cost','cumulative_cost',
+          'projection_factor','fug_height','fug_width_xdim','fug_length_ydim','fug_angle',
+          'annual_avg_hours_per_year'] + self.month_vals + [col for col in self.ann_cols 
+          if col.endswith('_pctred')]
         # Source identifier columns 
         self.id_cols = ['facility_id','unit_id','rel_point_id','process_id','oris_facility_code',
           'oris_boiler_id']
@@ -59,6 +67,10 @@ class FF10:
         # SCCs by unit/process
         self.sccs = pd.DataFrame()
         self.ann_head = []
+        # Optional partitioning of the output files
+        self.partitioner = Partitioner(opts.partition, opts.workers, self.get_manifest_fn(opts))
+        # Annual files written
+        self.annual_fns = []
 
     def extract_ann_emis(self, df):
         '''
@@ -77,43 +89,40 @@ class FF10:
         emis['unit_frac'] = emis['ann_value'] / emis['ann_value_unit']
         return emis[self.id_cols+['poll','ann_value','unit_frac']].copy()
 
-    def extract_monthly_emis(self, df):
+    def apply_growth(self, fn):
         '''
-        Extract monthly values at the specified level for scaling hourly values
-          Fill monthly from annual where necessary
+        Apply per-unit growth factors to the annual and monthly values in the annual FF10
+        The growth factor file is a CSV with oris_facility_code, oris_boiler_id, factor and an
+          optional poll column. A blank poll applies the factor to all pollutants for the unit.
         '''
-        import calendar
-        emis = df[self.id_cols+['poll','ann_value']+self.month_vals].copy()
-        # Keep only those units with a valid boiler and facility
-        emis = emis[(emis['oris_facility_code'].notnull()) & \
-          (emis['oris_boiler_id'].notnull())].copy()
-        # Set aside those units with populated monthly values
-        idx = emis[self.month_vals].fillna(0).sum(axis=1) > 0
-        popmon = emis[idx].copy()
-        # Apply a flat ann->month profile to those remaining
-        emis = emis[~ idx].copy()
-        fracs = {vname: calendar.monthrange(int(self.year), mon+1)[1]/\
-          (365+calendar.isleap(int(self.year))) for mon, vname in enumerate(self.month_vals)}
-        for col, frac in fracs.items():
-            emis[col] = emis['ann_value'].fillna(0) * frac
-        emis = pd.concat((emis, popmon))
-        emis = emis[self.id_cols+['poll',]+self.month_vals].groupby(self.id_cols+['poll',], 
-          as_index=False).sum()
-        # Melt down to month number
-        emis = pd.melt(emis, id_vars=self.id_cols+['poll',], 
-          var_name='monthname', value_name='montot')
-        # Map months to month number
-        montab = pd.DataFrame(list(enumerate(self.month_vals)), columns=['month','monthname'])
-        montab['month'] = (montab['month'].astype(int) + 1).astype(str)
-        emis = emis[emis['montot'].notnull()].merge(montab, on='monthname', how='left')
-        return emis[self.id_cols+['month','poll','montot']].copy()
-
-    def write_annual(self, annual, opts):
+        unitids = ['oris_facility_code','oris_boiler_id']
+        growth = pd.read_csv(fn, dtype={'oris_facility_code': str, 'oris_boiler_id': str, 'poll': str})
+        if 'poll' not in list(growth.columns):
+            growth['poll'] = ''
+        for col in unitids+['poll',]:
+            growth[col] = growth[col].fillna('').str.strip()
+        growth.drop_duplicates(unitids+['poll',], keep='last', inplace=True)
+        units = self.ann_ff10[unitids+['poll',]].copy()
+        for col in unitids+['poll',]:
+            units[col] = units[col].fillna('').astype(str).str.strip()
+        # Pollutant specific factors take precedence over the unit factors
+        units = units.merge(growth.loc[growth['poll'] != '', unitids+['poll','factor']], 
+          on=unitids+['poll',], how='left')
+        units = units.merge(growth.loc[growth['poll'] == '', unitids+['factor',]], on=unitids, 
+          how='left', suffixes=['','_unit'])
+        factor = units['factor'].fillna(units['factor_unit']).fillna(1).values
+        print('Growth factors applied to %s records' %(factor != 1).sum())
+        valcols = ['ann_value',] + self.month_vals
+        self.ann_ff10[valcols] = self.ann_ff10[valcols].multiply(factor, axis=0)
+
+    def write_annual(self, annual, opts, balance=None):
         '''
         Write the annual FF10
         Specify the output file name, 
+        Optionally add the output annual and monthly totals to a MassBalance
+        Returns the annual FF10 values
         '''
-        fn = os.path.join(opts.output_path, 'ptinv_%s_%s.csv' %(opts.year, opts.label))
+        fn = self.get_annual_fn(opts)
         monthly = self.calc_monthly_vals(annual)
         annual = annual.groupby(self.id_cols+['poll',], as_index=False).sum()
         annual = annual.merge(monthly, on=self.id_cols+['poll',], how='left', suffixes=['_old',''])
@@ -131,28 +140,42 @@ class FF10:
         annual.loc[idx, 'ann_value'] = annual.loc[idx, 'ann_value_cem']
         annual = annual.merge(monthly, on=self.id_cols+['poll',], how='left', suffixes=['_f',''])
         # Fill in a single country
-        country = str(annual['country_cd'].values[0])
+        country = self.get_country(annual)
         # Round these fields
         round_cols = ['ann_value','latitude','longitude']
         annual[round_cols] = annual[round_cols].round(8)
         for col in self.ann_cols:
             if col not in list(annual.columns):
                 annual[col] = None
+        parts = self.partitioner.write(annual, fn, self.write_annual_file, opts, country)
+        self.annual_fns = self.add_manifest('annual', '', parts, opts)
+        if balance is not None:
+            annual['monthsum'] = annual[self.month_vals].fillna(0).sum(axis=1)
+            balance.add('ff10_out', annual, 'ann_value', balance.annual_idx)
+            balance.add('ff10_out_months', annual, 'monthsum', balance.annual_idx)
+        return annual
+
+    def write_annual_file(self, annual, fn, opts, country):
+        '''
+        Write the annual FF10 and the columnar formats to an output file name
+        '''
         # Write the annual FF10 header
-        with open(fn, 'w') as f:
-            head = '#FORMAT=FF10_POINT\n#COUNTRY=%s\n#YEAR=%s\n' %(country, self.year)
-            f.write(head)
-            f.write('%s\n' %','.join(self.ann_cols))
-            # And data
-            annual.to_csv(f, columns=self.ann_cols, index=False, quoting=csv.QUOTE_NONNUMERIC,
-              header=False)
-        fn = os.path.join(os.path.dirname(fn), 'qa_%s'  %os.path.basename(fn))
-        write_annual_qa(fn, annual, self.ann_ff10, self.temporalvar)  
+        if 'ff10' in opts.output_format:
+            with open(fn, 'w') as f:
+                head = '#FORMAT=FF10_POINT\n#COUNTRY=%s\n#YEAR=%s\n' %(country, self.year)
+                f.write(head)
+                f.write('%s\n' %','.join(self.ann_cols))
+                # And data
+                annual.to_csv(f, columns=self.ann_cols, index=False, quoting=csv.QUOTE_NONNUMERIC,
+                  header=False)
+        self.write_columnar(annual, fn, opts, list(self.ann_cols), self.ann_numcols)
 
     def calc_monthly_vals(self, df):
         '''
         Calculate the monthly values from the daily values
         '''
+        if len(df) == 0:
+            return pd.DataFrame(columns=self.id_cols+['poll',]+self.month_vals)
         df['month'] = df['month'].astype(int)
         df = df.groupby(self.id_cols+['month','poll'], as_index=False).sum()
         df['month'] = df['month'].apply(lambda x: self.month_vals[x-1])
@@ -164,36 +187,126 @@ class FF10:
         df[self.month_vals] = df[self.month_vals].round(8)
         return df
 
-    def write_monthly_ff10(self, df, opts):
+    def write_monthly_ff10(self, df, opts, balance=None):
         '''
         Write the hourly monthly FF10
+        Optionally add the written daily totals to a MassBalance
+        Returns the list of files written
         '''
         month = int(df['date'].values[0][4:6])
-        fn = os.path.join(opts.output_path, 
-          'pthour_%0.2d_%s_%s_hourly.csv' %(int(month), opts.year, opts.label))
-        print(fn)
+        fn = self.get_hourly_fn(month, opts)
         country = str(df['country_cd'].drop_duplicates().values[0])
         year = str(df['date'].values[0])[:4]
         df[self.hrvals+['daytot',]] = df[self.hrvals+['daytot',]].round(8) 
         for col in self.hourly_cols:
             if col not in list(df.columns):
                 df[col] = ''
-        with open(fn, 'w') as f:
-            head = '#FORMAT=FF10_HOURLY_POINT\n#COUNTRY=%s\n#YEAR=%s\n' %(country, year)
-            f.write(head)
-            df.to_csv(f, columns=self.hourly_cols, index=False)
+        parts = self.partitioner.write(df, fn, self.write_hourly_file, opts, country, year)
+        if balance is not None:
+            balance.add('ff10', df)
+        return self.add_manifest('hourly', month, parts, opts)
+
+    def write_empty_monthly(self, opts):
+        '''
+        Write the hourly FF10 for each run month without any records
+        Returns the list of files written
+        '''
+        country = self.get_country(self.ann_ff10)
+        fns = []
+        for month in opts.months:
+            df = pd.DataFrame(columns=self.hourly_cols)
+            parts = self.partitioner.write(df, self.get_hourly_fn(month, opts), 
+              self.write_hourly_file, opts, country, opts.year)
+            fns += self.add_manifest('hourly', month, parts, opts)
+        return fns
+
+    def get_country(self, df):
+        '''
+        Get the country for the FF10 header from the first record
+        '''
+        if len(df) == 0:
+            return 'US'
+        return str(df['country_cd'].values[0])
+
+    def write_hourly_file(self, df, fn, opts, country, year):
+        '''
+        Write the hourly FF10 and the columnar formats to an output file name
+        '''
+        if 'ff10' in opts.output_format:
+            print(fn, flush=True)
+            with open(fn, 'w') as f:
+                head = '#FORMAT=FF10_HOURLY_POINT\n#COUNTRY=%s\n#YEAR=%s\n' %(country, year)
+                f.write(head)
+                df.to_csv(f, columns=self.hourly_cols, index=False)
+        self.write_columnar(df, fn, opts, self.hourly_cols, self.hrvals+['daytot',], ('date',))
+
+    def add_manifest(self, kind, month, parts, opts):
+        '''
+        Add the partition files written in each output format to the manifest
+        Returns the list of files written
+        '''
+        fns = []
+        for label, fn, records in parts:
+            for fmt, out_fn in zip(opts.output_format, self.get_output_fns(fn, opts)):
+                if self.partitioner.is_set():
+                    self.partitioner.add(kind, month, label, out_fn, fmt, records)
+                fns.append(out_fn)
+        self.partitioner.write_manifest()
+        return fns
+
+    def get_hourly_fn(self, month, opts):
+        '''
+        Get the hourly FF10 file name for the month
+        '''
+        return os.path.join(opts.output_path, 
+          'pthour_%0.2d_%s_%s_hourly.csv' %(int(month), opts.year, opts.label))
+
+    def get_annual_fn(self, opts):
+        '''
+        Get the annual FF10 file name
+        '''
+        return os.path.join(opts.output_path, 'ptinv_%s_%s.csv' %(opts.year, opts.label))
+
+    def get_manifest_fn(self, opts):
+        '''
+        Get the partition manifest file name
+        '''
+        return os.path.join(opts.output_path, 'manifest_%s_%s.csv' %(opts.year, opts.label))
+
+    def get_output_fns(self, fn, opts):
+        '''
+        Get the file names written in each output format for an FF10 file name
+        '''
+        return [fn if fmt == 'ff10' else columnar_fn(fn, fmt) for fmt in opts.output_format]
+
+    def write_columnar(self, df, fn, opts, cols, numcols, datecols=()):
+        '''
+        Write the typed columnar versions of an FF10 next to the FF10 file name
+        '''
+        for fmt in opts.output_format:
+            if fmt in COLUMNAR_EXT:
+                write_columnar(set_types(df, cols, numcols, datecols), columnar_fn(fn, fmt), fmt)
 
-    def read_ann_ff10(self, fn):
+    def read_ann_ff10(self, fn, subset=None):
         '''
         Read in the entire annual FF10
+        The FF10 may be uncompressed or compressed with gzip, zstandard, or zip
+        Optionally keep only the records in a Subset of facilities, units, and states. Only the
+          lines that may match the subset are parsed.
         '''
-        with open(fn) as f:
+        with open_text(fn) as f:
             for l in f:
                 if l.startswith('#') or l.strip() == '':
                     self.ann_head.append(l.strip())
                 else:
                     break
-        self.ann_ff10 = pd.read_csv(fn, dtype=self.ff10_dtype, skiprows=len(self.ann_head))
+        with open_text(fn) as f:
+            if subset is not None and subset.is_set():
+                f = subset.filter_lines(f, len(self.ann_head))
+            self.ann_ff10 = pd.read_csv(f, dtype=self.ff10_dtype, skiprows=len(self.ann_head))
+        if subset is not None:
+            self.ann_ff10 = subset.filter_ff10(self.ann_ff10)
+            print('Annual FF10 records in subset: %s' %len(self.ann_ff10))
         # Define metadata for the hourly processing
         self.fips = self.ann_ff10[['facility_id','country_cd','region_cd']].drop_duplicates('facility_id')
         self.sccs = self.ann_ff10[['unit_id','process_id','scc']].drop_duplicates(['unit_id','process_id'])
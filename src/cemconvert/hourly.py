@@ -0,0 +1,58 @@
+class HourlyStore:
+    '''
+    Month-partitioned store of the hourly CEM values joined to the annual inventory
+    The partitions are built once so the monthly processing does not rescan the full year
+    '''
+
+    def __init__(self, hourly, anndef, cem_temporal=None, profiles=None, units=None):
+        '''
+        hourly is the keyed hourly values joined to the annual FF10 units
+        anndef is the keyed annual emissions for the CEM pollutants
+        cem_temporal is the unit-level temporal factors from Temporal.calc_cem_temporal
+        profiles is a ProfileLibrary to get the temporal factors from instead of cem_temporal,
+          optionally limited to a dataframe of units
+        '''
+        # Find the units with 0 annual CEM emissions for replacement with temporalized annual values
+        zunit = hourly[hourly.oris_facility_code != ''].groupby(level=0)['daytot'].sum()
+        self.zidx = zunit[zunit == 0].index.unique()
+        # The annual values used to replace the zero CEM units are the same for every month
+        self.unitreplace = anndef[anndef.index.isin(self.zidx)].copy()
+        self.hourly = self.partition(hourly[hourly['month'].notnull()])
+        self.profiles = profiles
+        self.units = units
+        if profiles is None:
+            self.temporal = self.partition(cem_temporal)
+            # Empty temporal frame for months without any CEM activity
+            self.notemporal = cem_temporal.iloc[0:0].copy()
+        # Months in the order they appear in the hourly values
+        self.months = list(self.hourly.keys())
+
+    def partition(self, df, col='month'):
+        '''
+        Split a dataframe into a dictionary of dataframes by month
+        '''
+        return {month: mdf for month, mdf in df.groupby(col, sort=False)}
+
+    def get_hourly(self, month, cols):
+        '''
+        Get the hourly values for the month with the zero CEM units removed
+        '''
+        df = self.hourly[month]
+        return df.loc[~ df.index.isin(self.zidx), cols].copy()
+
+    def get_temporal(self, month):
+        '''
+        Get the unit-level temporal factors for the month
+        '''
+        if self.profiles is not None:
+            return self.profiles.get_temporal(month, self.units)
+        return self.temporal.get(month, self.notemporal)
+
+    def get_replacement(self, month, temp, mthtemp=None):
+        '''
+        Temporalize the annual values for the zero CEM units to the month
+        Optionally use the temporal factors for the month already from get_temporal
+        '''
+        if mthtemp is None:
+            mthtemp = self.get_temporal(month)
+        return temp.apply_temporal(self.unitreplace, mthtemp)
@@ -0,0 +1,127 @@
+import os.path
+import glob
+import re
+import pandas as pd
+from cemconvert.run_parse import shard_label
+from cemconvert.columnar import COLUMNAR_EXT, columnar_fn, read_columnar, write_columnar
+
+class ShardMerge:
+    '''
+    Combine the outputs of a sharded cemconvert run into the outputs of a single run
+    The shard outputs are found by the LABEL_shardIofN labels in the input path
+    '''
+
+    def __init__(self, input_path, output_path, year, label):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.year = year
+        self.label = label
+        # Number of shards
+        self.shards = 0
+        self.labels = []
+
+    def find_shards(self):
+        '''
+        Find the number of shards from the shard annual FF10 and check that all shards are done
+        '''
+        fns = glob.glob(os.path.join(self.input_path, 'ptinv_%s_%s_shard*of*.*' %(self.year,
+          self.label)))
+        found = set()
+        for fn in fns:
+            match = re.search(r'_shard(\d+)of(\d+)\.', os.path.basename(fn))
+            if match:
+                found.add((int(match.group(1)), int(match.group(2))))
+        counts = set(shards for shard, shards in found)
+        if len(counts) != 1:
+            raise ValueError('Could not find the annual FF10 for one set of shards of %s in %s'
+              %(self.label, self.input_path))
+        self.shards = counts.pop()
+        missing = [str(shard) for shard in range(1, self.shards+1) if 
+          (shard, self.shards) not in found]
+        if missing:
+            raise ValueError('Missing the annual FF10 for shards: %s' %', '.join(missing))
+        self.labels = [shard_label(self.label, shard, self.shards) for shard in
+          range(1, self.shards+1)]
+        if glob.glob(os.path.join(self.input_path, 'manifest_%s_%s_shard*.csv' %(self.year,
+          self.label))):
+            raise ValueError('Partitioned shard outputs cannot be merged')
+        print('Merging %s shards of %s' %(self.shards, self.label), flush=True)
+
+    def get_fns(self, pattern):
+        '''
+        Get the shard file names for a file name pattern with a label field
+        Returns the shard file names that exist and the merged file name
+        '''
+        fns = [os.path.join(self.input_path, pattern.format(label=label)) for label in self.labels]
+        out_fn = os.path.join(self.output_path, pattern.format(label=self.label))
+        return [fn for fn in fns if os.path.exists(fn)], out_fn
+
+    def merge_ff10(self, fns, out_fn):
+        '''
+        Concatenate the FF10 files using the header from the first shard
+        The FF10 records are copied as written by each shard
+        '''
+        cols = None
+        with open(out_fn, 'w') as out:
+            for fn in fns:
+                with open(fn) as f:
+                    head = []
+                    for line in f:
+                        head.append(line)
+                        if not line.startswith('#'):
+                            break
+                    if cols is None:
+                        cols = head[-1]
+                        out.write(''.join(head))
+                    elif head[-1] != cols:
+                        raise ValueError('FF10 columns in %s do not match the first shard' %fn)
+                    for line in f:
+                        out.write(line)
+        print(out_fn, flush=True)
+
+    def merge_csv(self, fns, out_fn, sort_cols=()):
+        '''
+        Concatenate the QA CSVs keeping the values as written
+        '''
+        df = pd.concat([pd.read_csv(fn, dtype=str, keep_default_na=False) for fn in fns])
+        if sort_cols:
+            df = df.sort_values(list(sort_cols), kind='stable')
+        df.to_csv(out_fn, index=False)
+        print(out_fn, flush=True)
+
+    def merge_columnar(self, pattern, out_fn):
+        '''
+        Concatenate any columnar versions of the shard FF10 files
+        '''
+        for fmt in COLUMNAR_EXT:
+            fns = [columnar_fn(os.path.join(self.input_path, pattern.format(label=label)), fmt)
+              for label in self.labels]
+            fns = [col_fn for col_fn in fns if os.path.exists(col_fn)]
+            if fns:
+                df = pd.concat([read_columnar(col_fn) for col_fn in fns], ignore_index=True)
+                write_columnar(df, columnar_fn(out_fn, fmt), fmt)
+                print(columnar_fn(out_fn, fmt), flush=True)
+
+    def merge(self):
+        '''
+        Merge all of the shard outputs
+        '''
+        self.find_shards()
+        ff10_patterns = ['pthour_%0.2d_%s_{label}_hourly.csv' %(month, self.year) for month in
+          range(1,13)] + ['ptinv_%s_{label}.csv' %self.year,]
+        for pattern in ff10_patterns:
+            fns, out_fn = self.get_fns(pattern)
+            if fns:
+                self.merge_ff10(fns, out_fn)
+            self.merge_columnar(pattern, out_fn)
+        # QA files and the columns to sort the merged records by
+        qa_patterns = [('cemcorrect_qa_{label}_%s.csv' %self.year, ()),
+          ('qa_ptinv_%s_{label}.csv' %self.year, ()),
+          ('mass_balance_%s_{label}.csv' %self.year, ('oris_facility_code','oris_boiler_id',
+            'poll'))]
+        qa_patterns += [('qa_pthour_%0.2d_%s_{label}.csv' %(month, self.year), ()) for month in
+          range(1,13)]
+        for pattern, sort_cols in qa_patterns:
+            fns, out_fn = self.get_fns(pattern)
+            if fns:
+                self.merge_csv(fns, out_fn, sort_cols)
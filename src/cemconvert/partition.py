@@ -0,0 +1,86 @@
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from cemconvert.subset import hash_shard
+
+class Partitioner:
+    '''
+    Split the FF10 outputs into partition files by state, facility, or a number of hash shards
+    The state is the region_cd state FIPS prefix and the facility is the EIS facility_id.
+      Shards are assigned by a hash of the facility_id so each facility stays in one shard.
+      The shards are numbered from 1 like the --shard runs.
+    A manifest of the partition files is rewritten after each output so downstream jobs can
+      start on the partitions already written
+    '''
+
+    def __init__(self, mode='', workers=0, manifest_fn=''):
+        # state, facility, or the number of hash shards. Blank for no partitioning.
+        self.mode = str(mode).strip().lower()
+        # Number of threads writing the partitions. Default is one per CPU.
+        self.workers = workers
+        self.manifest_fn = manifest_fn
+        # Files written by partition
+        self.manifest = pd.DataFrame(columns=['type','month','partition','format','file',
+          'records'])
+
+    def is_set(self):
+        '''
+        Check if the outputs are partitioned
+        '''
+        return self.mode != ''
+
+    def get_labels(self, df):
+        '''
+        Get the partition label for each record
+        '''
+        if self.mode == 'state':
+            fips = df['region_cd'].fillna('').astype(str).str.strip().str.zfill(5).str[:2]
+            return 'st' + fips
+        facility = df['facility_id'].fillna('').astype(str).str.strip()
+        if self.mode == 'facility':
+            return 'fac' + facility.str.replace(r'[^A-Za-z0-9\-]', '_', regex=True)
+        shards = int(self.mode)
+        # Use a stable hash so the shards are the same across months and runs. The shards are
+        #  numbered from 1 with the same hash as the --shard runs.
+        xref = dict((key, 'part%0.3d' %hash_shard(key, shards)) for key in facility.unique())
+        return facility.map(xref)
+
+    def get_fn(self, fn, label):
+        '''
+        Get the partition file name for an output file name
+        '''
+        base, ext = os.path.splitext(fn)
+        return '%s_%s%s' %(base, label, ext)
+
+    def write(self, df, fn, func, *args):
+        '''
+        Write a dataframe using func(df, fn, *args) either to fn or in parallel to the partitions
+        Returns the partition labels, file names, and record counts
+        '''
+        if not self.is_set():
+            func(df, fn, *args)
+            return [('', fn, len(df)),]
+        parts = [(label, self.get_fn(fn, label), part) for label, part in
+          df.groupby(self.get_labels(df).values)]
+        workers = self.workers if self.workers else (os.cpu_count() or 1)
+        workers = max(1, min(int(workers), len(parts)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(func, part, part_fn, *args) for label, part_fn, part in parts]
+            # Raise any write errors
+            for future in futures:
+                future.result()
+        return [(label, part_fn, len(part)) for label, part_fn, part in parts]
+
+    def add(self, kind, month, label, fn, fmt, records):
+        '''
+        Add a partition file to the manifest
+        '''
+        self.manifest.loc[len(self.manifest)] = [kind, month, label, fmt, os.path.basename(fn),
+          records]
+
+    def write_manifest(self):
+        '''
+        Write the manifest of partition files
+        '''
+        if self.is_set() and self.manifest_fn:
+            self.manifest.to_csv(self.manifest_fn, index=False)
@@ -0,0 +1,156 @@
+# Library entry point for running cemconvert without the command line
+
+import os.path
+import copy
+import pandas as pd
+from cemconvert.proc import proc_hourly, gapfill_dates, proc_hourly_meta, set_key
+from cemconvert.qa import MassBalance
+from cemconvert.ff10 import FF10
+from cemconvert.temporal import Temporal
+from cemconvert.tz import TZ
+from cemconvert.hourly import HourlyStore
+from cemconvert.scale import MonthlyScaler
+from cemconvert.partition import Partitioner
+from cemconvert.profiles import ProfileLibrary
+
+class RunResult(object):
+    '''
+    Outputs of a cemconvert run
+    '''
+
+    def __init__(self):
+        # Paths of the hourly and annual inventory files written
+        self.files = []
+        # Annual FF10 values as written
+        self.annual = pd.DataFrame()
+        # Hourly FF10 values by month. Only kept when requested.
+        self.hourly = {}
+        # Running QA totals by processing stage
+        self.balance = None
+        # Unit-level temporal profiles. Only kept when written.
+        self.profiles = None
+
+def run(config, inv=None, tz=None, temp=None, cems=None, keep_hourly=False):
+    '''
+    Run cemconvert using a RunConfig (or the command line RunOpts) and return a RunResult
+    Pre-loaded objects may be passed in and reused across runs. They are not changed by the run.
+      inv: FF10 with the annual FF10 already read by read_ann_ff10
+      tz: TZ with the county timezone table loaded
+      temp: Temporal
+      cems: CEM with the hourly values loaded by load_cems_period for at least the run months
+    Pre-loaded objects are filtered to any facility, unit, or state subset in the config
+    Set keep_hourly to return the hourly FF10 values by month in addition to writing them
+    '''
+    eisids = ['facility_id','unit_id','rel_point_id','process_id']
+    orisids = ['oris_facility_code','oris_boiler_id']
+    result = RunResult()
+    # Running unit totals by stage for the QA
+    balance = MassBalance()
+    result.balance = balance
+    # Read the profiles from a previous run to temporalize the annual values if given
+    profiles = None
+    if config.profiles:
+        profiles = ProfileLibrary()
+        profiles.read(config.profiles)
+        # The profiles are by hour of the year so they only apply to the same year
+        if profiles.year != int(config.year):
+            raise ValueError('Temporal profiles in %s are for %s, not the run year %s' 
+              %(config.profiles, profiles.year, config.year))
+    # Get full annual FF10 and header
+    if inv is None:
+        inv = FF10(config)
+        inv.read_ann_ff10(config.ann_ff10, subset=config.subset)
+    else:
+        inv = copy.copy(inv)
+        inv.year = config.year
+        inv.temporalvar = config.temporalvar
+        inv.ann_ff10 = config.subset.filter_ff10(inv.ann_ff10.copy())
+        inv.partitioner = Partitioner(config.partition, config.workers, 
+          inv.get_manifest_fn(config))
+    if config.growth:
+        inv.apply_growth(config.growth)
+    # The input totals are after any growth so the QA only shows the processing changes
+    balance.add('ff10_in', inv.ann_ff10, 'ann_value', balance.annual_idx)
+    annemis = inv.extract_ann_emis(inv.ann_ff10)
+    tz = TZ() if tz is None else copy.copy(tz)
+    tz.fips_to_unit(inv.oris_fips)
+    hourly = proc_hourly(config, tz, balance, cems)
+    if hourly is None:
+        # A shard without any CEMS units passes through its annual FF10 records so the
+        #  shard outputs can still be merged
+        result.files += inv.write_empty_monthly(config)
+        annual = pd.DataFrame(columns=eisids+orisids+['poll','daytot']).astype({'daytot': float})
+        result.annual = inv.write_annual(annual, config, balance)
+        result.files += inv.annual_fns
+        balance.write_qa(config)
+        return result
+    hourly = gapfill_dates(hourly.copy(), config.year)
+    # Calculate the unit-level CEMs temporal factors for annual->hourly
+    if temp is None:
+        temp = Temporal(config)
+    else:
+        temp = copy.copy(temp)
+        temp.temporalvar = config.temporalvar
+    # The CEMs temporal factors are only needed without a profile library or to write one
+    cem_temporal = None
+    if profiles is None or config.write_profiles:
+        cem_temporal = temp.calc_cem_temporal(hourly)
+    if config.write_profiles:
+        result.profiles = temp.calc_profiles(cem_temporal, config.year)
+        result.profiles.write(os.path.join(config.output_path, 'temporal_profiles_%s_%s' 
+          %(config.year, config.label)))
+    # Copy over the hourly CEM values and temporalize the annual inventory emissions to hourly
+    hourly = set_key(hourly[hourly['poll'].isin(config.cempolls)].copy())
+    anndef = set_key(annemis[annemis['poll'].isin(config.cempolls)].copy())
+    # Merge in and apply the unit to process ID fractions
+    hrcols = list(hourly.columns) + eisids
+    hourly = anndef.join(hourly, lsuffix='_ff10')
+    hourly[inv.hrvals+['daytot',]] = hourly[inv.hrvals+['daytot',]].fillna(0).\
+      multiply(hourly['unit_frac'].fillna(1), axis=0)
+    # Use the emissions values from the annual FF10 rather than the CEMs for pollutants
+    #  Matched to the CEMs
+    if config.keepann:
+        scaler = MonthlyScaler(config.year)
+        scaler.calc_targets(inv.ann_ff10)
+        hourly = scaler.scale_hourly(hourly)
+    hourly = set_key(hourly[hourly.ann_value.notnull()].copy())
+    # Split the hourly and temporal values by month once and find the units with 0 annual CEM
+    #  emissions for replacement with temporalized annual values
+    unit_xref = annemis[eisids+orisids].drop_duplicates()
+    store = HourlyStore(hourly, anndef, cem_temporal, profiles, unit_xref)
+    del hourly
+    # Loop over the months in the file. Doing this on the annual seems like a big memory sink
+    #  this could eventually be parallelized with the right tweeks
+    annual = []
+    for month in store.months:
+        print('Month %s' %int(month), flush=True)
+        balance.add('matched', store.hourly[month])
+        hourlymth = [store.get_hourly(month, hrcols),]
+        mthtemp = store.get_temporal(month)
+        # Temporalize non-CEM variables
+        for poll in config.calcpolls:
+            print(f'\tTemporalizing {poll} from annual using {config.temporalvar}')
+            hourly_poll = temp.apply_temporal(annemis[annemis['poll'] == poll], mthtemp)
+            hourlymth.append(set_key(hourly_poll))
+        # Replace units where the CEMs NOX/SO2/CO2 is 0 annually with temporalized annual
+        if len(store.zidx) > 0:
+            print(f'\tTemporalizing CEMs from annual using {config.temporalvar}')
+            hourlymth.append(set_key(store.get_replacement(month, temp, mthtemp)))
+        # Fill in the HOURACT variable for temporalization of other variables
+        #  A profile library may not cover any of the units in the month
+        if len(mthtemp) > 0:
+            mthtemp = mthtemp.merge(unit_xref, on=orisids, how='left')
+            mthtemp['poll'] = config.temporalvar
+            #  and append that to the hourly file
+            hourlymth.append(set_key(mthtemp))
+        hourlymth = proc_hourly_meta(pd.concat(hourlymth), inv.fips, inv.sccs)
+        result.files += inv.write_monthly_ff10(hourlymth, config, balance)
+        if keep_hourly:
+            result.hourly[int(month)] = hourlymth
+        # Append the daytot from the hourly to the annual dataframe
+        annual.append(hourlymth[eisids+orisids+['poll','month','daytot']])
+    annual = pd.concat(annual) if annual else pd.DataFrame()
+    result.annual = inv.write_annual(annual, config, balance)
+    result.files += inv.annual_fns
+    balance.write_qa(config)
+    return result
@@ -5,17 +5,42 @@ import pandas as pd
 from cemconvert.cem import CEM
 from cemconvert.cemcorrect import CemCorrect
 
-def proc_hourly(opts, tz):
+def proc_hourly(opts, tz, balance=None, cems=None):
     '''
     Read in the hourly CEM values by month in the new format
     Write to the old format
     Return a pivoted version
+    Optionally track the unit totals through each step in a MassBalance
+    A CEM with the hourly values already loaded may be passed in. The run months and the
+      subset are copied from it and it is left unchanged.
+    Returns None for a shard without any CEMS records
     '''
-    cems = CEM()
-    cems.load_cems_period(opts.input_path, opts.year, opts.months)
+    if cems is None:
+        cems = CEM(opts.subset)
+        cems.load_cems_period(opts.input_path, opts.year, opts.months, opts.workers,
+          opts.processes)
+    else:
+        loaded = cems
+        cems = CEM(opts.subset)
+        cems.hourly = loaded.hourly[loaded.hourly['month'].astype(int).isin(opts.months)].copy()
+        if cems.is_subset():
+            cems.hourly = opts.subset.filter_cems(cems.hourly, 'oris_facility_code', 
+              'oris_boiler_id', 'State')
+    if len(cems.hourly) == 0:
+        # The hash split may leave a shard without any CEMS units
+        if opts.subset.shard:
+            print('No CEMS records found for shard %s of %s' %tuple(opts.subset.shard))
+            return None
+        raise ValueError('No CEMS records found for the run months and unit selection')
+    # Read the adjacent month hours that shift into the run months so they are also corrected
+    boundary = None
+    if opts.gmt_output and opts.boundary:
+        boundary = load_boundary_hours(cems, opts, tz)
+    if balance is not None:
+        balance.add('cems', cems.calc_unit_totals(pd.concat([cems.hourly, boundary])))
     # Run CEMCorrect
     if opts.cemcorrect:
-        correct = CemCorrect()
+        correct = CemCorrect(opts.peakfactor, opts.threshold)
         # Start by calculating the means of the non-flagged values
         for col in correct.valcols:
             correct.calc_mean(col, cems.hourly)
@@ -26,14 +51,28 @@ def proc_hourly(opts, tz):
             if col != 'HTINPUT':
                 correct.calc_rate(col, cems.hourly)
                 cems.hourly = correct.fill_rate(col, cems.hourly)
+        # The boundary hours use the annual means as they are outside of the run months
+        if boundary is not None:
+            boundary = correct.fill_boundary(boundary)
         fn = os.path.join(opts.output_path, 'cemcorrect_qa_%s_%s.csv' %(opts.label, opts.year))
         correct.write_qa(fn)
+        if balance is not None:
+            balance.adjust('cemcorrect', 'cems', cems.lbs_to_tons(correct.calc_adjustments()))
     cems.write_old_cems(opts.input_path, opts.year, opts.months)
     if opts.ertac:
         cems.write_ertac_cems(opts.input_path, opts.year, opts.months)
     # Timeshift hourly FF10 to GMT
     if opts.gmt_output:
+        if boundary is not None:
+            cems.hourly = pd.concat([cems.hourly, boundary])
         cems.hourly = tz.timeshift_to_gmt(cems.hourly)
+        if boundary is not None:
+            # Drop the hours that shifted out of the run months
+            idx = (cems.hourly.date.dt.year.astype(int) == int(opts.year)) & \
+              (cems.hourly.date.dt.month.astype(int).isin(opts.months))
+            cems.hourly = cems.hourly[idx].copy()
+            if opts.ramp_up:
+                print('Boundary hours loaded from the adjacent CEMS. Ramp-up hours are not used.')
     # Extract the hour into the hour column and reset the date
     cems.hourly['hour'] = cems.hourly.date.dt.hour.astype(int)
     cems.hourly['date'] = cems.hourly.date.dt.normalize()
@@ -44,8 +83,40 @@ def proc_hourly(opts, tz):
     idx = ['oris_facility_code','oris_boiler_id','date','poll']
     cems.hourly = cems.hourly.groupby(idx, as_index=False).sum()
     cems.hourly['month'] = cems.hourly.date.dt.month.astype(int).astype(str)
+    if balance is not None:
+        balance.add('hourly', cems.hourly)
     return cems.hourly
 
+def load_boundary_hours(cems, opts, tz):
+    '''
+    Read the hours from the adjacent CEMS months that shift into the run months for GMT output
+    Only the boundary hours of the adjacent months are read
+    Returns None if an adjacent month file is not available
+    '''
+    offsets = tz.tbl.loc[tz.tbl['oris_facility_code'].notnull(), 'lst_offset'].dropna()
+    if len(offsets) == 0:
+        return None
+    # Hours needed from the month before and the month after a run month
+    before = int(max(-offsets.min(), 0))
+    after = int(max(offsets.max(), 0))
+    year = int(opts.year)
+    boundary = []
+    try:
+        for month in opts.months:
+            first = pd.Timestamp(year, month, 1)
+            prev = first - pd.offsets.MonthBegin(1)
+            nxt = first + pd.offsets.MonthBegin(1)
+            if before and not (prev.year == year and prev.month in opts.months):
+                boundary.append(cems.read_boundary_hours(opts.input_path, prev.year, prev.month, 
+                  before, tail=True))
+            if after and not (nxt.year == year and nxt.month in opts.months):
+                boundary.append(cems.read_boundary_hours(opts.input_path, nxt.year, nxt.month, 
+                  after, tail=False))
+    except FileNotFoundError as e:
+        print('Boundary hours not loaded: %s' %e)
+        return None
+    return pd.concat(boundary) if boundary else None
+
 def gapfill_dates(df, year):
     '''
     Gapfill the dates by unit/poll combo to have all dates for every month in the run
@@ -102,22 +173,3 @@ def set_key(df, cols=['oris_facility_code','oris_boiler_id','poll']):
     df['key'] = df[cols].agg('_'.join, axis=1)
     df.set_index('key', inplace=True)
     return df.copy()
-
-def scale_hourly(hourly, monemis):
-    '''
-    Scale the hourly values to the monthly values from the annual FF10
-    '''
-    hrcols = list(hourly.columns)
-    # Roll the hourly up to monthly
-    idx = ['oris_facility_code','oris_boiler_id','poll','month']
-    hrmonth = hourly[idx+['daytot',]].reset_index().groupby(idx, as_index=False).sum()
-    unitfac = monemis.merge(hrmonth, on=idx, how='left')
-    # Calculate a unit monthly factor for CEMs to annual FF10
-    unitfac['scalar'] = unitfac['montot'].fillna(0)/unitfac['daytot'].fillna(0)
-    hourly = hourly.merge(unitfac[idx+['scalar',]], on=idx, how='left')
-    print(list(hourly.columns))
-    valcols = ['daytot',]+['hrval%s' %hr for hr in range(24)]
-    hourly[valcols] = hourly[valcols].fillna(0).multiply(hourly['scalar'].fillna(0), axis=0)
-    return hourly[hrcols].copy()
-
-
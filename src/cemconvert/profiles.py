@@ -0,0 +1,158 @@
+import calendar
+import numpy as np
+import pandas as pd
+
+class ProfileLibrary:
+    '''
+    Library of unit-level hourly temporal profiles from the CEMs activity
+    Each unit has a float32 array of the fraction of the annual activity in each hour of the year
+      (8760 or 8784 hours) and the temporal hierarchy variable used for the unit
+    The profiles are stored as <name>.npy and are memory-mapped when read. The unit index is
+      stored as <name>.csv with the months of the year covered by the CEMs of each unit. Hours
+      in months that are not covered are not used.
+    '''
+
+    def __init__(self, year=2016):
+        self.year = int(year)
+        # Fields to use to identify a unit
+        self.unitids = ['oris_facility_code','oris_boiler_id']
+        self.hrfracs = ['hrfrac%s' %x for x in range(24)]
+        self.hrvals = ['hrval%s' %x for x in range(24)]
+        # Unit IDs, temporal variable, annual activity total, and covered months by profile row
+        self.units = pd.DataFrame(columns=self.unitids+['tempvar','anntot','months'])
+        self.profiles = np.zeros((0, self.get_hours()), dtype=np.float32)
+        # Unit IDs to profile row
+        self.rows = {}
+        # Set of covered months by profile row
+        self.coverage = []
+
+    def get_hours(self):
+        '''
+        Number of hours in the year
+        '''
+        return 8784 if calendar.isleap(self.year) else 8760
+
+    def get_day(self, date):
+        '''
+        Day of the year from 0 for a date
+        '''
+        return (pd.Timestamp(date) - pd.Timestamp(self.year, 1, 1)).days
+
+    def set_rows(self):
+        '''
+        Index the profile rows and the covered months by unit
+        '''
+        self.rows = dict((unit, n) for n, unit in enumerate(zip(self.units['oris_facility_code'],
+          self.units['oris_boiler_id'])))
+        self.coverage = [set(int(month) for month in str(months).split()) for months in 
+          self.units['months'].fillna('')]
+
+    def is_covered(self, row, month):
+        '''
+        Check if the profile row covers a month
+        '''
+        return int(month) in self.coverage[row]
+
+    def calc_profiles(self, cem_temporal, unit_vars):
+        '''
+        Set the profiles from the unit-level temporal factors of Temporal.calc_cem_temporal
+        unit_vars is the temporal variable and annual total by unit from the same Temporal
+        '''
+        df = cem_temporal[cem_temporal['date'].dt.year == self.year]
+        self.units = unit_vars[self.unitids+['tempvar','anntot']].drop_duplicates(self.unitids).\
+          reset_index(drop=True)
+        # Months with CEMs temporal factors by unit as a space-delimited list
+        months = df.groupby(self.unitids)['date'].agg(lambda dates: ' '.join(str(month) for 
+          month in sorted(dates.dt.month.unique())))
+        self.units['months'] = [months.get(unit, '') for unit in zip(self.units['oris_facility_code'],
+          self.units['oris_boiler_id'])]
+        self.set_rows()
+        self.profiles = np.zeros((len(self.units), self.get_hours()), dtype=np.float32)
+        rows = np.array([self.rows.get(unit, -1) for unit in zip(df['oris_facility_code'],
+          df['oris_boiler_id'])], dtype=int)
+        days = (df['date'] - pd.Timestamp(self.year, 1, 1)).dt.days.values
+        idx = rows >= 0
+        # Hour of the year for each day and hour
+        hours = days[idx, np.newaxis] * 24 + np.arange(24)
+        self.profiles[rows[idx, np.newaxis], hours] = df[self.hrfracs].values[idx]
+
+    def write(self, fn):
+        '''
+        Write the profiles and unit index using a file name without an extension
+        '''
+        np.save('%s.npy' %fn, self.profiles)
+        units = self.units.copy()
+        units['year'] = self.year
+        units.to_csv('%s.csv' %fn, index=False)
+        print('Wrote %s temporal profiles to %s.npy' %(len(self.units), fn))
+
+    def read(self, fn):
+        '''
+        Read the unit index and memory-map the profiles using a file name without an extension
+        '''
+        self.units = pd.read_csv('%s.csv' %fn, dtype={'oris_facility_code': str,
+          'oris_boiler_id': str, 'tempvar': str, 'months': str})
+        if 'months' not in list(self.units.columns):
+            raise ValueError('Temporal profiles in %s.csv do not list the covered months' %fn)
+        if len(self.units) > 0:
+            self.year = int(self.units['year'].values[0])
+        self.units = self.units[self.unitids+['tempvar','anntot','months']]
+        self.profiles = np.load('%s.npy' %fn, mmap_mode='r')
+        if self.profiles.shape != (len(self.units), self.get_hours()):
+            raise ValueError('Temporal profiles in %s.npy do not match the unit index' %fn)
+        self.set_rows()
+
+    def get_profile(self, facility, unit):
+        '''
+        Get the hourly profile for the year of a unit without copying it
+        Returns None if the unit is not in the library. Hours in months that are not covered are 0.
+        '''
+        row = self.rows.get((str(facility), str(unit)))
+        if row is None:
+            return None
+        return self.profiles[row]
+
+    def get_day_profile(self, facility, unit, date):
+        '''
+        Get the 24 hourly fractions of a unit for a date without copying them
+        Returns None if the unit is not in the library or the month is not covered
+        '''
+        row = self.rows.get((str(facility), str(unit)))
+        if row is None or not self.is_covered(row, pd.Timestamp(date).month):
+            return None
+        profile = self.profiles[row]
+        day = self.get_day(date)
+        return profile[day*24:(day+1)*24]
+
+    def get_temporal(self, month, units=None):
+        '''
+        Get the daily and hourly temporal factors for a month in the layout of
+          Temporal.calc_cem_temporal for apply_temporal
+        The activity values are the factors multiplied by the annual activity total of the unit
+        Optionally limit to a dataframe of units
+        Units that do not cover the month are left out so they are handled as unmatched units
+        '''
+        if units is None:
+            rows = list(range(len(self.units)))
+        else:
+            units = units[self.unitids].drop_duplicates()
+            rows = [self.rows[unit] for unit in zip(units['oris_facility_code'],
+              units['oris_boiler_id']) if unit in self.rows]
+        rows = [row for row in rows if self.is_covered(row, month)]
+        start = pd.Timestamp(self.year, int(month), 1)
+        dates = pd.date_range(start, periods=start.daysinmonth, freq='D')
+        first = self.get_day(start)
+        fracs = np.asarray(self.profiles[rows, first*24:(first+len(dates))*24], dtype=float)
+        fracs = fracs.reshape(len(rows)*len(dates), 24)
+        df = pd.DataFrame(fracs, columns=self.hrfracs)
+        df.insert(0, 'oris_facility_code', np.repeat(self.units['oris_facility_code'].values[rows],
+          len(dates)))
+        df.insert(1, 'oris_boiler_id', np.repeat(self.units['oris_boiler_id'].values[rows],
+          len(dates)))
+        df.insert(2, 'month', str(int(month)))
+        df.insert(3, 'date', np.tile(dates.values, len(rows)))
+        df.insert(4, 'dayfrac', fracs.sum(axis=1))
+        anntot = np.repeat(self.units['anntot'].values[rows].astype(float), len(dates))
+        df.insert(5, 'daytot', df['dayfrac'].values * anntot)
+        df[self.hrvals] = fracs * anntot[:, np.newaxis]
+        return df
@@ -1,39 +1,115 @@
 import os.path
 import pandas as pd
 
-def write_annual_qa(fn, annual, ann_ff10, temporalvar):
+class MassBalance:
     '''
-    Write the QA of the annual inventory
+    Running unit/pollutant totals of the values emitted by each processing stage
+    The QA files and the mass-balance report are written from these totals at the end of the run
+      rather than regrouping the full hourly and annual data
     '''
-    idx = ['facility_id','unit_id','oris_facility_code','oris_boiler_id','poll']
-    month_vals = ['jan_value','feb_value','mar_value','apr_value','may_value','jun_value',
-      'jul_value','aug_value','sep_value','oct_value','nov_value','dec_value']
-    annual['monthsum'] = annual[month_vals].fillna(0).sum(axis=1).round(6)
-    outunit = annual[idx+['ann_value','monthsum']].groupby(idx, as_index=False).sum()
-    inunit = ann_ff10[idx+['ann_value',]].groupby(idx, as_index=False).sum()
-    qa = pd.merge(inunit, outunit, on=idx, how='outer', suffixes=['_in','_out'])
-    qa = qa[qa['poll'] != temporalvar].copy()
-    qa['diff'] = (qa['ann_value_out'].fillna(0) - qa['ann_value_in'].fillna(0)).round(4)
-    qa['absolute_pctdiff'] = (abs(qa['diff']/qa['ann_value_in'].fillna(0)) * 100).round(2)
-    qa[['ann_value_in','ann_value_out']] = qa[['ann_value_in','ann_value_out']].round(6)
-    qa.to_csv(fn, index=False)
-
-def write_hourly_qa(hourly, hourlymth, opts):
-    '''
-    Write the hourly QA of the CEM data
-    '''
-    month = int(hourlymth['month'].drop_duplicates().values[0])
-    fn = os.path.join(opts.output_path, 
-      'qa_pthour_%0.2d_%s_%s.csv' %(month, opts.year, opts.label))
-    idx = ['oris_facility_code','oris_boiler_id','month','poll']
-    inunit = hourly.loc[hourly['month'] == month, idx+['ann_value',]].groupby(idx, 
-      as_index=False).sum()
-    outunit = hourlymth.loc[hourlymth['month'] == month, idx+['ann_value',]].groupby(idx, 
-      as_index=False).sum()
-    qa = pd.merge(inunit, outunit, on=idx, how='outer', suffixes=['_in','_out'])
-    qa = qa[qa['poll'].isin(('NOX','SO2'))].copy()
-    qa['diff'] = (qa['ann_value_out'].fillna(0) - qa['ann_value_in'].fillna(0)).round(6)
-    qa['pd'] = abs(qa['diff']/qa['ann_value_in'].fillna(0)) * 100
-    qa[(qa['diff'] != 0) & (qa['pd'] > 0.01)].to_csv(fn, index=False)
 
+    def __init__(self):
+        self.unitids = ['oris_facility_code','oris_boiler_id']
+        # Totals for the hourly stages are kept by unit/pollutant/month
+        self.hourly_idx = self.unitids + ['poll','month']
+        # Totals for the annual stages are kept by process unit/pollutant
+        self.annual_idx = ['facility_id','unit_id','oris_facility_code','oris_boiler_id','poll']
+        # Hourly stages in processing order
+        self.hourly_stages = ['cems','cemcorrect','hourly','matched','ff10']
+        self.month_vals = ['jan_value','feb_value','mar_value','apr_value','may_value','jun_value',
+          'jul_value','aug_value','sep_value','oct_value','nov_value','dec_value']
+        # Stage name to running totals
+        self.totals = {}
+
+    def add(self, stage, df, valcol='daytot', idx=None):
+        '''
+        Add the values emitted by a stage to the running totals for that stage
+        '''
+        if idx is None:
+            idx = self.hourly_idx
+        part = df[idx+[valcol,]].groupby(idx, as_index=False)[valcol].sum()
+        part.rename(columns={valcol: stage}, inplace=True)
+        if 'month' in idx:
+            part['month'] = part['month'].astype(int).astype(str)
+        if stage in self.totals:
+            part = pd.concat((self.totals[stage], part)).groupby(idx, as_index=False)[stage].sum()
+        self.totals[stage] = part
+
+    def adjust(self, stage, base, df, valcol='daytot', idx=None):
+        '''
+        Define a stage as the totals of a previous stage plus a set of adjustments
+        '''
+        if idx is None:
+            idx = self.hourly_idx
+        self.totals[stage] = self.totals[base].rename(columns={base: stage})
+        self.add(stage, df, valcol, idx)
+
+    def get_totals(self, stages, idx=None):
+        '''
+        Merge the totals for the stages side-by-side
+        Stages that were not run are skipped
+        '''
+        if idx is None:
+            idx = self.hourly_idx
+        qa = pd.DataFrame(columns=idx)
+        for stage in stages:
+            if stage in self.totals:
+                df = self.totals[stage].groupby(idx, as_index=False)[stage].sum()
+                qa = pd.merge(qa, df, on=idx, how='outer')
+            else:
+                qa[stage] = None
+        return qa
+
+    def write_hourly_qa(self, opts):
+        '''
+        Write the hourly QA of the CEM data by month
+        Compares the CEMs matched to the inventory units to the values written to the hourly FF10
+        '''
+        qa = self.get_totals(['matched','ff10'])
+        qa.rename(columns={'matched': 'daytot_in', 'ff10': 'daytot_out'}, inplace=True)
+        qa = qa[qa['poll'].isin(('NOX','SO2'))].copy()
+        qa['diff'] = (qa['daytot_out'].fillna(0) - qa['daytot_in'].fillna(0)).round(6)
+        qa['pd'] = abs(qa['diff']/qa['daytot_in'].fillna(0)) * 100
+        for month in self.totals.get('ff10', qa)['month'].drop_duplicates():
+            fn = os.path.join(opts.output_path, 
+              'qa_pthour_%0.2d_%s_%s.csv' %(int(month), opts.year, opts.label))
+            idx = (qa['month'] == month) & (qa['diff'] != 0) & (qa['pd'] > 0.01)
+            qa[idx].to_csv(fn, index=False)
+
+    def write_annual_qa(self, opts):
+        '''
+        Write the QA of the annual inventory
+        '''
+        fn = os.path.join(opts.output_path, 'qa_ptinv_%s_%s.csv' %(opts.year, opts.label))
+        qa = self.get_totals(['ff10_in','ff10_out','ff10_out_months'], self.annual_idx)
+        qa.rename(columns={'ff10_in': 'ann_value_in', 'ff10_out': 'ann_value_out', 
+          'ff10_out_months': 'monthsum'}, inplace=True)
+        qa = qa[qa['poll'] != opts.temporalvar].copy()
+        qa[['ann_value_in','ann_value_out','monthsum']] = \
+          qa[['ann_value_in','ann_value_out','monthsum']].astype(float)
+        qa['monthsum'] = qa['monthsum'].round(6)
+        qa['diff'] = (qa['ann_value_out'].fillna(0) - qa['ann_value_in'].fillna(0)).round(4)
+        qa['absolute_pctdiff'] = (abs(qa['diff']/qa['ann_value_in'].fillna(0)) * 100).round(2)
+        qa[['ann_value_in','ann_value_out']] = qa[['ann_value_in','ann_value_out']].round(6)
+        qa.to_csv(fn, index=False)
+
+    def write_report(self, opts):
+        '''
+        Write the stage-by-stage mass-balance report by unit and pollutant
+        Each stage diff is the change in the unit total from the previous stage that was run
+        '''
+        fn = os.path.join(opts.output_path, 'mass_balance_%s_%s.csv' %(opts.year, opts.label))
+        stages = [stage for stage in self.hourly_stages if stage in self.totals]
+        qa = self.get_totals(stages, self.unitids+['poll',])
+        qa[stages] = qa[stages].fillna(0).round(6)
+        for prev, stage in zip(stages[:-1], stages[1:]):
+            qa[f'{stage}_diff'] = (qa[stage] - qa[prev]).round(6)
+        qa.sort_values(self.unitids+['poll',]).to_csv(fn, index=False)
 
+    def write_qa(self, opts):
+        '''
+        Write all of the QA from the running totals
+        '''
+        self.write_hourly_qa(opts)
+        self.write_annual_qa(opts)
+        self.write_report(opts)
@@ -1,21 +1,28 @@
 import os
-from sys import exit
 from optparse import OptionParser,OptionGroup
+from cemconvert.subset import Subset
 
-class RunOpts(object):
+class RunConfig(object):
     '''
-    Command line arguments
+    Run configuration that can be built without the command line
+    Options default to the command line defaults and are set by keyword using the option
+      destination names, ie. RunConfig('ptegu_annual_ff10.csv', year='2021', gmt_output=True)
+    List options may be given as a comma-delimited string or as a list
     '''
 
-    def __init__(self):
-        self.set_ev()
-        options, args = self.get_opts()
-        self.check_valid(options, args)
+    def __init__(self, ann_ff10='', **kwargs):
+        self.evs = {}
+        options, args = self.get_opts([])
+        for opt, val in kwargs.items():
+            if not hasattr(options, opt):
+                raise ValueError('Unknown run option: %s' %opt)
+            setattr(options, opt, val)
+        self.check_valid(options)
         self.set_opt_args(options)
-        self.set_cmd_args(args)
+        self.ann_ff10 = ann_ff10
         self.init_run()
 
-    def get_opts(self):
+    def get_opts(self, argv=None):
         '''
         Handle command line arguments and options.
         '''
@@ -35,6 +42,9 @@ class RunOpts(object):
           help='Output hourly FF10 to GMT instead of local time', default=False)
         self.parser.add_option('-r', '--ramp_up', action='store_true', dest='ramp_up', 
           help='Timeshift hours for the year after the designated year back one year', default=False)
+        self.parser.add_option('-b', '--boundary_hours', action='store_true', dest='boundary', 
+          help='With GMT output read the boundary hours from the adjacent month CEMS that shift \
+            into the run months and drop the hours that shift out of the run months', default=False)
         self.parser.add_option('-t', '--temporal_var', dest='temporalvar', 
           help='Variable name used for temporal activity', default='HOURACT')
         self.parser.add_option('-n', '--inven_polls', dest='calcpolls', 
@@ -47,57 +57,104 @@ class RunOpts(object):
         self.parser.add_option('-k', '--keep_annual', dest='keepann', action='store_true',
           default=False, help='Keep and temporalize annual temporal values in FF10 that match CEMs.\
             Default is to replace the emissions values with CEMs.')
+        self.parser.add_option('-f', '--growth_factors', dest='growth', default='',
+          help='CSV of per-unit growth factors to apply to the annual FF10 values.\
+            Typically used with -k to project the hourly CEMs.')
+        self.parser.add_option('-w', '--write_profiles', dest='write_profiles', action='store_true',
+          default=False, help='Write the unit-level hourly temporal profiles as a profile library')
+        self.parser.add_option('-u', '--profiles', dest='profiles', default='',
+          help='Profile library written by a previous run to temporalize the annual values. \
+            Give the file name without the .npy extension.')
         self.parser.add_option('-e', '--cemcorrect', dest='cemcorrect', action='store_true',
           default=False, help='Apply CEMCorrect to the CEMS')
-        return self.parser.parse_args()
-
-    def set_ev(self):
-        '''
-        Set the attributes with the environment variables
-        '''
-        self.evs = {'MONTHS': 'months', 'YEAR': 'year', 'CEMPATH': 'input_path', 
-          'OUTPATH': 'output_path'}
-        for ev, att_name in self.evs.items():
-            setattr(self, att_name, check_ev(ev))
+        self.parser.add_option('--peakfactor', dest='peakfactor', type='float', default=3,
+          help='CEMCorrect factor over the mean for a flagged value to be replaced')
+        self.parser.add_option('--threshold', dest='threshold', type='float', default=0.3,
+          help='CEMCorrect fraction of days in the month with values to use the monthly mean')
+        self.parser.add_option('--sweep_peakfactors', dest='sweep_peakfactors', default='',
+          help='Comma-delimited list of CEMCorrect peakfactors to evaluate in a sweep. \
+            Writes the CEMCorrect QA for each setting and a summary instead of a full run.')
+        self.parser.add_option('--sweep_thresholds', dest='sweep_thresholds', default='',
+          help='Comma-delimited list of CEMCorrect thresholds to evaluate in a sweep')
+        self.parser.add_option('--sweep_full', dest='sweep_full', default='',
+          help='Comma-delimited list of sweep settings as PEAKFACTOR:THRESHOLD to also write \
+            the full outputs for, ie. 3:0.3,4:0.2')
+        self.parser.add_option('-x', '--output_format', dest='output_format', default='ff10',
+          help='Comma-delimited list of output formats: ff10, parquet, and/or arrow. \
+            The parquet and arrow formats require pyarrow.')
+        self.parser.add_option('-j', '--workers', dest='workers', type='int', default=0,
+          help='Number of workers for reading the monthly CEM files and writing the output \
+            partitions in parallel. Default is one per month up to the number of CPUs.')
+        self.parser.add_option('--processes', action='store_true', dest='processes', default=False,
+          help='Read the monthly CEM files with a pool of processes instead of threads')
+        self.parser.add_option('-s', '--partition', dest='partition', default='',
+          help='Partition the hourly and annual FF10 outputs by state, facility, or a number of \
+            hash shards, ie. state or 16. Writes a manifest of the partition files.')
+        self.parser.add_option('--facilities', dest='facilities', default='',
+          help='Comma-delimited list of ORIS facility codes to process. \
+            Default is all facilities.')
+        self.parser.add_option('--units', dest='units', default='',
+          help='Comma-delimited list of ORIS units to process as FACILITY:UNIT, ie. 3:1,3:2')
+        self.parser.add_option('--states', dest='states', default='',
+          help='Comma-delimited list of state abbreviations to process. \
+            Used with --facilities or --units only those in the states are processed.')
+        self.parser.add_option('--shard', dest='shard', default='',
+          help='Process shard i of N of the ORIS units as i/N, ie. 2/8. \
+            Outputs are labeled LABEL_shardIofN for cemconvert-merge.')
+        return self.parser.parse_args(argv)
 
     def set_opt_args(self, options):
         '''
         Set the self.parser options to object attributes
         '''
         int_list = ['months',]
-        lower_list = []
-        upper_list = ['cempolls','calcpolls']
+        float_list = ['sweep_peakfactors','sweep_thresholds']
+        str_list = ['facilities','units','sweep_full']
+        lower_list = ['output_format',]
+        upper_list = ['cempolls','calcpolls','states']
         for opt, val in options.__dict__.items():
             if type(val) == str:
                 val = val.strip()
             if opt in int_list:
                 if val != '':
-                    val = [int(x) for x in val.strip().split(',')]
+                    val = [int(x) for x in to_list(val)]
+            elif opt in float_list:
+                val = [float(x) for x in to_list(val)]
+            elif opt in str_list:
+                val = to_list(val)
             elif opt in lower_list:
-                val = [col.strip() for col in val.lower().strip().split(',')]
+                val = [col.lower() for col in to_list(val)]
             elif opt in upper_list:
-                val = [col.strip() for col in val.upper().strip().split(',')]
+                val = [col.upper() for col in to_list(val)]
             # Don't override an att that was set by an EV but not set on the command line
             if opt in self.evs and opt == '':
                 pass
             else:
                 setattr(self, opt, val)
 
-    def set_cmd_args(self, args):
-        ''''
-        Map the command line arguments to the internal variable
-        '''
-        self.ann_ff10 = args[0]
-
-    def check_valid(self, options, args):
+    def check_valid(self, options):
         '''
         Misc. option validity checks
         '''
-        if len(args) != 1: 
-            print('Must specify an input annual FF10')
-            exit()
-        if len(options.cempolls) == 0:
+        if len(to_list(options.cempolls)) == 0:
             raise ValueError('No CEM variables specified. Nothing to do.')
+        for fmt in to_list(options.output_format):
+            if fmt.lower() not in ('ff10','parquet','arrow'):
+                raise ValueError('Unknown output format: %s' %fmt)
+        partition = str(options.partition).strip().lower()
+        if partition not in ('','state','facility') and \
+          not (partition.isdigit() and int(partition) > 0):
+            raise ValueError('Partition must be state, facility, or a number of shards')
+        for setting in to_list(options.sweep_full):
+            try:
+                peakfactor, threshold = [float(x) for x in setting.split(':')]
+            except ValueError:
+                raise ValueError('Sweep settings must be given as PEAKFACTOR:THRESHOLD, not %s'
+                  %setting)
+        if options.shard:
+            shard = get_shard(options.shard)
+            if not shard or not 1 <= shard[0] <= shard[1]:
+                raise ValueError('Shard must be given as i/N with i from 1 to N')
 
     def init_run(self): 
         '''
@@ -105,6 +162,67 @@ class RunOpts(object):
         '''
         if not self.months:
             self.months = range(1,13)
+        # Run a CemCorrect sweep instead of a single run
+        self.sweep = bool(self.sweep_peakfactors or self.sweep_thresholds or self.sweep_full)
+        # Facilities, units, states, and shard to keep as the CEMS and annual FF10 are read
+        shard = get_shard(self.shard)
+        self.subset = Subset(self.facilities, self.units, self.states, shard)
+        if shard:
+            self.label = shard_label(self.label, *shard)
+
+class RunOpts(RunConfig):
+    '''
+    Command line arguments
+    '''
+
+    def __init__(self, argv=None):
+        self.set_ev()
+        options, args = self.get_opts(argv)
+        if len(args) != 1: 
+            self.parser.error('Must specify an input annual FF10')
+        self.check_valid(options)
+        self.set_opt_args(options)
+        self.set_cmd_args(args)
+        self.init_run()
+
+    def set_ev(self):
+        '''
+        Set the attributes with the environment variables
+        '''
+        self.evs = {'MONTHS': 'months', 'YEAR': 'year', 'CEMPATH': 'input_path', 
+          'OUTPATH': 'output_path'}
+        for ev, att_name in self.evs.items():
+            setattr(self, att_name, check_ev(ev))
+
+    def set_cmd_args(self, args):
+        ''''
+        Map the command line arguments to the internal variable
+        '''
+        self.ann_ff10 = args[0]
+
+def to_list(val):
+    '''
+    Split a comma-delimited string option into a list
+    '''
+    if type(val) == str:
+        val = val.split(',')
+    return [str(x).strip() for x in val if str(x).strip() != '']
+
+def get_shard(val):
+    '''
+    Get the shard number and number of shards from an i/N string
+    '''
+    try:
+        shard, shards = [int(x) for x in str(val).split('/')]
+    except ValueError:
+        return None
+    return (shard, shards)
+
+def shard_label(label, shard, shards):
+    '''
+    Get the output label for a shard
+    '''
+    return '%s_shard%sof%s' %(label, shard, shards)
 
 def check_ev(ev_name):
     """
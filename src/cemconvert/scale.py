@@ -0,0 +1,65 @@
+import calendar
+import numpy as np
+import pandas as pd
+
+class MonthlyScaler:
+    '''
+    Scale the hourly CEM values to the monthly values in the annual FF10
+    The scalars are held in a (process/pollutant, month) array that is applied to the hourly 
+      values by position rather than by merging on the string IDs
+    '''
+
+    def __init__(self, year):
+        self.year = int(year)
+        # Process and pollutant fields that define a scaling target
+        self.ids = ['facility_id','unit_id','rel_point_id','process_id','oris_facility_code',
+          'oris_boiler_id','poll']
+        self.month_vals = ['jan_value','feb_value','mar_value','apr_value','may_value','jun_value',
+          'jul_value','aug_value','sep_value','oct_value','nov_value','dec_value']
+        self.valcols = ['daytot',] + ['hrval%s' %hr for hr in range(24)]
+        # Index of the process/pollutant keys to the rows of the targets array
+        self.keys = pd.MultiIndex.from_tuples([], names=self.ids)
+        self.targets = np.zeros((0, 12))
+
+    def get_keys(self, df):
+        '''
+        Get a normalized index of the process/pollutant fields
+        '''
+        keys = pd.DataFrame({col: df[col].fillna('').astype(str).str.strip() for col in self.ids})
+        return pd.MultiIndex.from_frame(keys)
+
+    def calc_targets(self, ann_ff10):
+        '''
+        Set the monthly target values by process and pollutant from the annual FF10
+        Units without populated monthly values get a flat annual->month profile
+        '''
+        emis = ann_ff10[(ann_ff10['oris_facility_code'].notnull()) & \
+          (ann_ff10['oris_boiler_id'].notnull())]
+        monthly = emis[self.month_vals].fillna(0).to_numpy(dtype=float)
+        days = np.array([calendar.monthrange(self.year, mon)[1] for mon in range(1,13)])
+        flat = ~ (monthly.sum(axis=1) > 0)
+        monthly[flat] = emis['ann_value'].fillna(0).to_numpy(dtype=float)[flat, None] * \
+          (days / days.sum())
+        # Sum duplicate process/pollutant records
+        codes, self.keys = self.get_keys(emis).factorize()
+        self.targets = np.zeros((len(self.keys), 12))
+        np.add.at(self.targets, codes, monthly)
+
+    def scale_hourly(self, hourly):
+        '''
+        Scale the hourly values to the monthly target values
+        Hourly values without a matching target or CEM total for the month are set to 0
+        '''
+        nkeys = len(self.keys)
+        key = self.keys.get_indexer(self.get_keys(hourly))
+        month = pd.to_numeric(hourly['month']).fillna(0).astype(int).to_numpy() - 1
+        valid = (key >= 0) & (month >= 0)
+        pos = key[valid] * 12 + month[valid]
+        # Roll the hourly up to monthly and calculate the CEMs to annual FF10 scalars
+        daytot = hourly['daytot'].fillna(0).to_numpy(dtype=float)[valid]
+        cem = np.bincount(pos, weights=daytot, minlength=nkeys*12).reshape(nkeys, 12)
+        scalars = np.divide(self.targets, cem, out=np.zeros_like(self.targets), where=cem > 0)
+        factor = np.zeros(len(hourly))
+        factor[valid] = scalars.ravel()[pos]
+        hourly[self.valcols] = hourly[self.valcols].fillna(0).to_numpy(dtype=float) * factor[:, None]
+        return hourly
@@ -0,0 +1,126 @@
+import os.path
+import io
+import zlib
+import pandas as pd
+
+class Subset:
+    '''
+    Selection of ORIS facilities, ORIS units, and states applied as the CEMS and FF10 are read
+    Units are given as FACILITY:UNIT. A record is selected when it matches any of the facilities
+      or units and, when states are given, is in one of the states.
+    A shard (i, N) selects a deterministic 1 of N split of the ORIS units by a hash of the unit.
+      Annual FF10 records without ORIS IDs are in the first shard.
+    '''
+
+    def __init__(self, facilities=(), units=(), states=(), shard=None):
+        self.facilities = set(str(fac).strip() for fac in facilities if str(fac).strip())
+        self.units = set()
+        for unit in units:
+            if ':' not in str(unit):
+                raise ValueError('Units must be given as FACILITY:UNIT, not %s' %unit)
+            fac, boiler = str(unit).split(':', 1)
+            self.units.add((fac.strip(), boiler.strip()))
+        self.states = set(str(st).strip().upper() for st in states if str(st).strip())
+        # State FIPS codes used to match the FF10 region_cd
+        self.state_fips = set()
+        if self.states:
+            tz_fn = os.path.join(os.path.dirname(__file__), 'data', 'county_fips_tz.csv')
+            tbl = pd.read_csv(tz_fn, usecols=['region_cd','stabbr'], dtype=str)
+            tbl = tbl[tbl['stabbr'].str.upper().isin(self.states)]
+            self.state_fips = set(tbl['region_cd'].str.zfill(5).str[:2])
+            missing = self.states - set(tbl['stabbr'].str.upper())
+            if missing:
+                raise ValueError('Unknown state abbreviations: %s' %', '.join(sorted(missing)))
+        # Shard number from 1 and number of shards
+        self.shard = shard
+
+    def is_set(self):
+        '''
+        Check if any selection is set
+        '''
+        return bool(self.facilities or self.units or self.states or self.shard)
+
+    def get_tokens(self):
+        '''
+        Get the strings that any selected line must contain
+        The facility IDs are used if set, otherwise the state codes. Shards do not filter lines.
+        '''
+        facs = self.facilities | set(fac for fac, boiler in self.units)
+        if not (facs or self.states):
+            return None
+        if facs:
+            return [',%s,' %fac for fac in facs] + [',"%s",' %fac for fac in facs]
+        return [',%s' %st for st in self.states | self.state_fips] + \
+          [',"%s' %st for st in self.states | self.state_fips] + \
+          ['%s,' %st for st in self.states] + ['"%s",' %st for st in self.states]
+
+    def filter_lines(self, f, skiprows=0):
+        '''
+        Pre-filter a CSV stream to the header and the lines that could match the selection
+        Lines are filtered before parsing so only candidate rows are parsed. The parsed
+          records still need to be filtered exactly.
+        '''
+        tokens = self.get_tokens()
+        if tokens is None:
+            return f
+        lines = [f.readline() for n in range(skiprows+1)]
+        lines += [line for line in f if any(token in line for token in tokens)]
+        return io.StringIO(''.join(lines))
+
+    def get_idx(self, facility, unit, region=None, state=None):
+        '''
+        Get the selected records for series of ORIS facility and unit IDs and
+          either the region_cd or state abbreviation
+        '''
+        facility = facility.fillna('').astype(str).str.strip()
+        unit = unit.fillna('').astype(str).str.strip()
+        if self.facilities or self.units:
+            idx = facility.isin(self.facilities)
+            if self.units:
+                pairs = pd.MultiIndex.from_arrays([facility, unit])
+                idx = idx | pairs.isin(list(self.units))
+        else:
+            idx = pd.Series(True, index=facility.index)
+        if self.states:
+            if state is not None:
+                idx = idx & state.fillna('').astype(str).str.strip().str.upper().isin(self.states)
+            else:
+                fips = region.fillna('').astype(str).str.strip().str.zfill(5).str[:2]
+                idx = idx & fips.isin(self.state_fips)
+        if self.shard:
+            idx = idx & self.get_shards(facility, unit).eq(self.shard[0])
+        return idx
+
+    def get_shards(self, facility, unit):
+        '''
+        Get the shard number of each ORIS unit from a stable hash of the facility and unit IDs
+        Records without an ORIS facility are in the first shard
+        '''
+        keys = facility + ':' + unit
+        xref = dict((key, hash_shard(key, self.shard[1])) for key in keys.unique())
+        shards = keys.map(xref)
+        shards[facility == ''] = 1
+        return shards
+
+    def filter_cems(self, df, facility='Facility ID', unit='Unit ID', state='State'):
+        '''
+        Filter the CEMS records to the selection
+        '''
+        if not self.is_set():
+            return df
+        return df[self.get_idx(df[facility], df[unit], state=df[state]).values].copy()
+
+    def filter_ff10(self, df):
+        '''
+        Filter the annual FF10 records to the selection
+        '''
+        if not self.is_set():
+            return df
+        idx = self.get_idx(df['oris_facility_code'], df['oris_boiler_id'], region=df['region_cd'])
+        return df[idx.values].copy()
+
+def hash_shard(key, shards):
+    '''
+    Get the shard number from 1 to shards of a key from a stable crc32 hash
+    '''
+    return zlib.crc32(str(key).encode()) % int(shards) + 1
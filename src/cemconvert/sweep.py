@@ -0,0 +1,199 @@
+import os.path
+import copy
+import numpy as np
+import pandas as pd
+from cemconvert.cem import CEM
+from cemconvert.cemcorrect import CemCorrect
+from cemconvert.ff10 import FF10
+from cemconvert.tz import TZ
+
+class CemCorrectSweep:
+    '''
+    Evaluate CemCorrect over a grid of peakfactor and threshold values
+    The unit-hour-month groups, counts, means, and flagged replacement candidates do not depend
+      on the parameters and are calculated once from the hourly CEMS. Each setting only selects
+      the heat input means, fills the heat input, and recalculates the rates by group code.
+    The replacements match a CemCorrect run with the same parameters for the run months. The
+      boundary hours of GMT runs are not read for the sweep.
+    '''
+
+    def __init__(self, hourly):
+        self.hourly = hourly
+        self.correct = CemCorrect()
+        heat = self.correct.heat
+        # Unit-hour-month and unit-hour group codes for each record
+        self.um = hourly.groupby(self.correct.unitmonth, sort=False).ngroup().values
+        self.uh = hourly.groupby(self.correct.unithour, sort=False).ngroup().values
+        self.n_um = self.um.max() + 1 if len(self.um) > 0 else 0
+        self.n_uh = self.uh.max() + 1 if len(self.uh) > 0 else 0
+        # Unit-hour and days in the month of each unit-hour-month
+        self.um_uh = np.zeros(self.n_um, dtype=int)
+        self.um_uh[self.um] = self.uh
+        self.days = np.zeros(self.n_um)
+        self.days[self.um] = hourly['date'].dt.daysinmonth.values
+        # Records with any measurement code flagged as anomalous
+        self.anom = hourly[self.correct.anomcols].gt(2).any(axis=1).values
+        self.himeas = hourly[self.correct.measmap[heat]].values
+        self.vals = dict((col, hourly[col].values.astype(float)) for col in self.correct.valcols)
+        # Measured or calculated records used in the means by variable
+        self.meas = dict((col, hourly[self.correct.measmap[col]].isin((1,2)).values) for col in
+          self.correct.valcols)
+        # Flagged records that are replacement candidates by variable
+        self.cands = dict((col, np.flatnonzero(self.anom & ~np.isnan(self.vals[col]))) for col in
+          self.correct.valcols)
+        # Heat input monthly and annual means and counts that do not depend on the threshold
+        rows = self.meas[heat]
+        self.heat_stats = self.calc_stats(self.vals[heat][rows], self.um[rows], self.uh[rows])
+
+    def calc_stats(self, vals, um, uh):
+        '''
+        Calculate the unit-hour-month counts and means and the unit-hour means of the non-null
+          values by group code
+        Returns the groups with records, counts, monthly means, and annual means
+        '''
+        present = np.zeros(self.n_um, dtype=bool)
+        present[um] = True
+        valid = ~np.isnan(vals)
+        cnt = np.bincount(um[valid], minlength=self.n_um)
+        monmean = pd.Series(vals[valid]).groupby(um[valid]).mean()
+        monmeans = np.full(self.n_um, np.nan)
+        monmeans[monmean.index.values] = monmean.values
+        annmean = pd.Series(vals[valid]).groupby(uh[valid]).mean()
+        annmeans = np.full(self.n_uh, np.nan)
+        annmeans[annmean.index.values] = annmean.values
+        return present, cnt, monmeans, annmeans
+
+    def select_means(self, stats, threshold):
+        '''
+        Select the monthly mean for the unit-hour-months at or over the threshold fraction of days
+          with values, otherwise the annual unit-hour mean
+        Returns the means and the groups that have a mean record
+        '''
+        present, cnt, monmeans, annmeans = stats
+        monthly = (cnt / self.days) >= threshold
+        means = np.where(monthly, monmeans, annmeans[self.um_uh])
+        # Groups without records or over the threshold without values have no mean record
+        keys = present & ~(monthly & (cnt == 0))
+        means[~keys] = np.nan
+        return means, keys
+
+    def get_qa(self, col, rows, orig, repl):
+        '''
+        Get the replaced records in the CemCorrect QA layout
+        '''
+        meascol = self.correct.measmap[col]
+        df = self.hourly.iloc[rows][['oris_facility_code','oris_boiler_id','date','hour','month',
+          meascol]].copy()
+        df['field'] = col
+        df['original_value'] = orig
+        df['replacement_value'] = repl
+        return df.rename(columns={meascol: 'measurement_code'})
+
+    def evaluate(self, peakfactor, threshold):
+        '''
+        Evaluate one peakfactor and threshold setting
+        Returns a CemCorrect with the replacement QA for the setting
+        '''
+        correct = CemCorrect(peakfactor, threshold)
+        heat = correct.heat
+        qa = []
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Heat input means limited to the groups with heat input records
+            heat_means, heat_keys = self.select_means(self.heat_stats, threshold)
+            # Fill the anomalous heat input with the mean
+            heat_vals = self.vals[heat].copy()
+            rows = self.cands[heat]
+            means = heat_means[self.um[rows]]
+            idx = (heat_vals[rows] > means * peakfactor) & (np.nan_to_num(means) > 0)
+            rows, means = rows[idx], means[idx]
+            qa.append(self.get_qa(heat, rows, heat_vals[rows], means))
+            heat_vals[rows] = means
+            for col in correct.valcols:
+                if col == heat:
+                    continue
+                # Rates using the filled heat input or the mean heat input where the heat input is
+                #  missing or flagged and over 2 times the mean
+                rows = np.flatnonzero(self.meas[col])
+                rowheat = heat_vals[rows]
+                means = heat_means[self.um[rows]]
+                idx = (np.nan_to_num(rowheat) == 0) | ((self.himeas[rows] > 2) &
+                  (np.nan_to_num(rowheat) > means * 2))
+                rowheat[idx] = means[idx]
+                rates = np.nan_to_num(self.vals[col][rows], nan=0) / rowheat
+                rates[~(rates > 0)] = np.nan
+                rate_means = self.select_means(self.calc_stats(rates, self.um[rows], self.uh[rows]),
+                  threshold)[0]
+                # Only the rates for the groups with heat input mean records are kept
+                rate_means[~heat_keys | ~(rate_means > 0)] = np.nan
+                # Fill the anomalous values with the mean rate times the mean heat input
+                rows = self.cands[col]
+                means = np.nan_to_num(rate_means[self.um[rows]], nan=0) * \
+                  np.nan_to_num(heat_means[self.um[rows]], nan=0)
+                idx = (self.vals[col][rows] > means * peakfactor) & (means > 0)
+                rows, means = rows[idx], means[idx]
+                qa.append(self.get_qa(col, rows, self.vals[col][rows], means))
+        correct.unitqa = pd.concat(qa)
+        return correct
+
+    def summarize(self, correct):
+        '''
+        Sum the replacements for a setting by field
+        '''
+        df = correct.unitqa.groupby('field', as_index=False).agg(
+          replacements=('original_value', 'count'), original_value=('original_value', 'sum'),
+          replacement_value=('replacement_value', 'sum'))
+        df['change'] = df['replacement_value'] - df['original_value']
+        df.insert(0, 'threshold', correct.threshold)
+        df.insert(0, 'peakfactor', correct.peakfactor)
+        return df
+
+def setting_label(label, peakfactor, threshold):
+    '''
+    Get the output label for a CemCorrect setting
+    '''
+    return '%s_pf%g_th%g' %(label, peakfactor, threshold)
+
+def run_sweep(config):
+    '''
+    Run a CemCorrect sweep over the grid of config.sweep_peakfactors and config.sweep_thresholds
+    Reads the CEMS once and writes the replacement QA for each setting and a summary of the
+      replacements for all settings. The full outputs are written for the config.sweep_full
+      settings given as PEAKFACTOR:THRESHOLD.
+    '''
+    from cemconvert.pipeline import run
+    peakfactors = config.sweep_peakfactors if config.sweep_peakfactors else [config.peakfactor,]
+    thresholds = config.sweep_thresholds if config.sweep_thresholds else [config.threshold,]
+    cems = CEM(config.subset)
+    cems.load_cems_period(config.input_path, config.year, config.months, config.workers,
+      config.processes)
+    if len(cems.hourly) == 0:
+        raise ValueError('No CEMS records found for the run months and unit selection')
+    sweep = CemCorrectSweep(cems.hourly)
+    summary = []
+    for peakfactor in peakfactors:
+        for threshold in thresholds:
+            print('CemCorrect peakfactor: %g  threshold: %g' %(peakfactor, threshold), flush=True)
+            correct = sweep.evaluate(peakfactor, threshold)
+            fn = os.path.join(config.output_path, 'cemcorrect_qa_%s_%s.csv' %(setting_label(
+              config.label, peakfactor, threshold), config.year))
+            summary.append(sweep.summarize(correct))
+            correct.write_qa(fn)
+    fn = os.path.join(config.output_path, 'cemcorrect_sweep_%s_%s.csv' %(config.label,
+      config.year))
+    pd.concat(summary).to_csv(fn, index=False)
+    print(fn)
+    # Write the full outputs for the selected settings reusing the loaded inputs
+    if config.sweep_full:
+        inv = FF10(config)
+        inv.read_ann_ff10(config.ann_ff10, subset=config.subset)
+        tz = TZ()
+        for setting in config.sweep_full:
+            peakfactor, threshold = [float(x) for x in setting.split(':')]
+            print('Full run for CemCorrect peakfactor: %g  threshold: %g' %(peakfactor,
+              threshold), flush=True)
+            setting_config = copy.copy(config)
+            setting_config.cemcorrect = True
+            setting_config.peakfactor = peakfactor
+            setting_config.threshold = threshold
+            setting_config.label = setting_label(config.label, peakfactor, threshold)
+            run(setting_config, inv=inv, tz=tz, cems=cems)
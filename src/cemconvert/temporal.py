@@ -1,3 +1,6 @@
+import pandas as pd
+from cemconvert.profiles import ProfileLibrary
+
 class Temporal:
     '''
     Functions for calculating temporal factors from CEM activity and applying them
@@ -15,6 +18,8 @@ class Temporal:
         self.hrfracs = ['hrfrac%s' %x for x in range(24)]
         # Fields to use to identify a unit
         self.unitids = ['oris_facility_code','oris_boiler_id']
+        # Temporal hierarchy variable and annual activity total by unit
+        self.unit_vars = pd.DataFrame(columns=self.unitids+['tempvar','anntot'])
 
     def set_temporal_var(self, annsum):
         '''
@@ -47,6 +52,9 @@ class Temporal:
         annsum.rename(columns={'daytot': 'anntot'}, inplace=True)
         annsum = self.set_temporal_var(annsum)
         idx = (annsum['tempvar'].fillna(999) != 999)
+        self.unit_vars = annsum.loc[idx, self.unitids+['tempvar','anntot']].copy()
+        self.unit_vars['tempvar'] = self.unit_vars['tempvar'].astype(int).map(
+          dict(enumerate(self.temporal_hierarchy)))
         # Merge in these annual values
         df = df.merge(annsum[idx], on=cols, how='left')
         df.loc[df['tempvar'].fillna(999) != 999, 'poll'] = self.temporalvar
@@ -60,12 +68,23 @@ class Temporal:
         df = df[cols+self.hrfracs+self.hrvals].groupby(cols, as_index=False).sum()
         return df
 
-    def apply_temporal(self, emis, houract):
+    def calc_profiles(self, cem_temporal, year):
+        '''
+        Get a ProfileLibrary of the unit-level temporal factors from calc_cem_temporal
+        '''
+        profiles = ProfileLibrary(year)
+        profiles.calc_profiles(cem_temporal, self.unit_vars)
+        return profiles
+
+    def apply_temporal(self, emis, houract, month=None):
         '''
         Apply the hourly temporal factors to an annual value
         In: annual emissions and hourly factors by ORIS IDs
         Out: hourly emissions by ORIS ID
+        The hourly factors may also be a ProfileLibrary with the month to apply
         '''
+        if isinstance(houract, ProfileLibrary):
+            houract = houract.get_temporal(month, emis)
 
         fracs = houract[self.unitids+['month','date','dayfrac']+self.hrfracs].reset_index()
         emis = emis[self.unitids+['poll','ann_value','unit_frac']].merge(fracs, on=self.unitids, how='left')
@@ -14,15 +14,17 @@ class TZ:
         lst_offset is the offset from UTC in local standard time (LST)
         '''
         tz_fn = os.path.join(os.path.dirname(__file__), 'data', 'county_fips_tz.csv')
-        self.tbl = pd.read_csv(tz_fn, 
+        self.county_tbl = pd.read_csv(tz_fn, 
                                usecols=['region_cd','tzname','lst_offset'], 
                                dtype={'region_cd': str})
+        self.tbl = self.county_tbl
 
     def fips_to_unit(self, oris_fips):
         '''
         Reset the table so it converts ORIS unit IDs to tz
+        The county table is kept so the units can be reset for another inventory
         '''
-        self.tbl = self.tbl.merge(oris_fips, on='region_cd', how='left')
+        self.tbl = self.county_tbl.merge(oris_fips, on='region_cd', how='left')
         self.tbl = self.tbl[['oris_facility_code','oris_boiler_id','tzname','lst_offset']].copy()
 
     def timeshift_to_gmt(self, df):